@@ -0,0 +1,158 @@
+"""Recording of production Slack traffic for replay with scripts/replay.py.
+
+When `BOT_CAPTURE_FILE` is set, requests to the command and events endpoints are appended to it
+as JSON lines, by a background thread. Payloads are anonymized before they are written: tokens,
+URLs and names are dropped, Slack ids are replaced by pseudonyms and presenters given with
+`--who` are replaced by placeholders. Set `BOT_CAPTURE_SALT` to get the same pseudonyms in all
+workers and across restarts.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from bot_api import logs
+
+
+CAPTURE_FILE = os.environ.get("BOT_CAPTURE_FILE")
+CAPTURE_SALT = os.environ.get("BOT_CAPTURE_SALT") or os.urandom(16).hex()
+CAPTURED_PATHS = ("/api/v1.0/command", "/api/v1.0/events")
+CAPTURED_HEADERS = ("content-type", "x-slack-retry-num", "x-slack-retry-reason")
+
+# Fields that are not needed to replay a request, and may be secret or personal
+DROPPED_FIELDS = {
+    "token",
+    "response_url",
+    "trigger_id",
+    "user_name",
+    "team_domain",
+    "channel_name",
+    "enterprise_name",
+    "authorizations",
+    "authed_users",
+    "event_context",
+    "blocks",
+    "user_profile",
+    "bot_profile",
+}
+# Slack ids, replaced by pseudonyms of the same form
+PSEUDONYMIZED_FIELDS = {
+    "user_id",
+    "channel_id",
+    "team_id",
+    "enterprise_id",
+    "api_app_id",
+    "user",
+    "channel",
+    "team",
+    "bot_id",
+}
+
+# "--who" or "--who=" and what follows it, up to the next option
+WHO_PATTERN = re.compile(r"(--who[=\s]\s*)(.*?)(?=\s+--|\s*$)")
+MENTION_PATTERN = re.compile(r"<@(\w+)>")
+
+logger = logging.getLogger(__name__)
+
+
+def pseudonymize(value: str) -> str:
+    """Replaces a Slack id like U012AB3CD by a stable pseudonym starting with the same letter."""
+    digest = hashlib.sha256(f"{CAPTURE_SALT}:{value}".encode("utf-8")).hexdigest()[:10].upper()
+    return f"{value[:1]}{digest}"
+
+
+def anonymize_text(text: str) -> str:
+    text = WHO_PATTERN.sub(lambda m: f"{m.group(1)}person-{pseudonymize(m.group(2))[1:7].lower()}", text)
+    return MENTION_PATTERN.sub(lambda m: f"<@{pseudonymize(m.group(1))}>", text)
+
+
+def anonymize(value):
+    """Anonymizes a decoded payload, recursively."""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key in DROPPED_FIELDS:
+                continue
+            if key in PSEUDONYMIZED_FIELDS and isinstance(item, str):
+                result[key] = pseudonymize(item)
+            elif key == "text" and isinstance(item, str):
+                result[key] = anonymize_text(item)
+            else:
+                result[key] = anonymize(item)
+        return result
+
+    if isinstance(value, list):
+        return [anonymize(item) for item in value]
+
+    return value
+
+
+def anonymize_body(body: bytes, content_type: str) -> str:
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        return urlencode(anonymize(dict(parse_qsl(body.decode("utf-8")))))
+
+    try:
+        return json.dumps(anonymize(json.loads(body)), separators=(",", ":"))
+    except ValueError:
+        return ""
+
+
+class CaptureFormatter(logging.Formatter):
+    def format(self, record):
+        entry = record.capture
+        entry["body"] = anonymize_body(entry["body"], entry["headers"].get("content-type", ""))
+        return json.dumps(entry, separators=(",", ":"))
+
+
+class CaptureMiddleware:
+    """ASGI middleware recording the requests to CAPTURED_PATHS, their status and latency."""
+
+    def __init__(self, app, filename: str):
+        self.app = app
+        logs.setup_file_logger(__name__, filename, CaptureFormatter())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in CAPTURED_PATHS:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        entry = {"time": time.time(), "path": scope["path"], "status": None, "ms": None}
+
+        # Slack payloads are small, so the body is read up front and handed on in one piece
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        sent = False
+
+        async def receive_recorded():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def send_and_record(message):
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+            elif message["type"] == "http.response.body" and not message.get("more_body"):
+                # Measured when the response is complete, not after background tasks
+                entry["ms"] = round((time.perf_counter() - start) * 1000, 2)
+            await send(message)
+
+        try:
+            await self.app(scope, receive_recorded, send_and_record)
+        finally:
+            headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+            entry["headers"] = {k: headers[k] for k in CAPTURED_HEADERS if k in headers}
+            # Anonymized and serialized by the logging thread
+            entry["body"] = body
+            logger.info("", extra={"capture": entry})
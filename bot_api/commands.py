@@ -5,7 +5,7 @@ from typing import Optional
 from sqlalchemy.orm import Session
 import dateparser
 
-from bot_api import crud
+from bot_api import crud, stats
 from bot_api.errors import (
     AlreadyCancelledError,
     AlreadyClearedError,
@@ -19,9 +19,16 @@ from bot_api.errors import (
     UsageError,
 )
 from bot_api.models import Event
+from bot_api.registry import Command, CommandRegistry
 
 
 event_types = ["fagdag", "formiddag"]
+search_page_size = 10
+upcoming_page_size = 10
+# Largest --limit, so that a page of upcoming events fits in the messages of one response
+upcoming_max_limit = 50
+# Slack shows at most this many characters of a message's text
+max_message_length = 3000
 default_responses = {
     "NO_EVENTS": "No upcoming events.",
     "INVALID_DATE_ERROR": "Error: Unable to parse date.",
@@ -35,6 +42,12 @@ default_responses = {
     "ALREADY_CANCELLED_ERROR": "Error: This event has (already) been cancelled.",
     "ALREADY_CLEARED_ERROR": "Error: This event is already empty.",
     "ALREADY_SCHEDULED_ERROR": "Error: A presentation has already been scheduled on this date.",
+    "RATE_LIMITED": "Slow down! You are sending commands too fast, please try again in a moment.",
+    "BUSY": "Sorry, I'm busy right now. Please try again in a moment.",
+    "NO_SEARCH_RESULTS": "No events found.",
+    "MORE_RESULTS": "More results: `{0}`",
+    "TRUNCATED": "_The rest was cut off, use `--page` to see more._",
+    "DID_YOU_MEAN": "Sorry, I don't know `{0}`. Did you mean {1}?",
     "CALL_TO_ACTION": "No one is scheduled for the next presentation ({0}). The due date is *{1}* at 23:59.",
 }
 
@@ -45,19 +58,20 @@ class CustomArgumentParser(ArgumentParser):
         # self.exit(2, '%s: error: %s\n' % (self.prog, message))
 
 
-def prettify_date(date):
-    return date.strftime("%a %-d %b")
+def prettify_date(date, with_year: bool = False):
+    return date.strftime("%a %-d %b %Y" if with_year else "%a %-d %b")
 
 
-def get_formatted_event(event: Event):
+def get_formatted_event(event: Event, with_year: bool = False):
     is_fagdag = str(event.event_type) == "fagdag"
+    when = prettify_date(event.when, with_year=with_year)
 
     if event.what is None:
-        response = f"*{prettify_date(event.when)}*: No presentation scheduled."
+        response = f"*{when}*: No presentation scheduled."
     elif event.who is None:
-        return f"*{prettify_date(event.when)}*: Event is cancelled due to {event.what}!"
+        return f"*{when}*: Event is cancelled due to {event.what}!"
     else:
-        response = f"*{prettify_date(event.when)}*: Presentation *{event.what}* by *{event.who}*."
+        response = f"*{when}*: Presentation *{event.what}* by *{event.who}*."
 
     fagdag_tag = " :busts_in_silhouette: Fagdag" if is_fagdag else ""
     return f"{response}{fagdag_tag}"
@@ -72,8 +86,11 @@ def get_args_from_request(request):
     cmd_parser.add_argument("--who", nargs="+", type=str)
     cmd_parser.add_argument("--what", nargs="+", type=str)
     cmd_parser.add_argument("--when", nargs="+", type=str)
+    cmd_parser.add_argument("--until", nargs="+", type=str)
     cmd_parser.add_argument("--event", type=str)
     cmd_parser.add_argument("--silent", "-s", action="store_true")
+    cmd_parser.add_argument("--page", type=int, default=1)
+    cmd_parser.add_argument("--limit", type=int)
 
     args = cmd_parser.parse_args(request.split())
 
@@ -81,6 +98,7 @@ def get_args_from_request(request):
     args.who = " ".join(args.who).replace('"', "") if args.who else None
     args.what = " ".join(args.what).replace('"', "") if args.what else None
     args.when = " ".join(args.when).replace('"', "") if args.when else None
+    args.until = " ".join(args.until).replace('"', "") if args.until else None
 
     return args
 
@@ -217,95 +235,274 @@ def list_next_event(args, db: Optional[Session] = None):
 
 
 def list_upcoming_events(args, db: Optional[Session] = None):
-    db_events = crud.get_upcoming_events(db, when=datetime.date.today())
-    if db_events is None:
+    if (args.limit is not None and args.limit < 1) or args.page < 1:
+        raise UsageError
+    limit = min(args.limit or upcoming_page_size, upcoming_max_limit)
+
+    until = None
+    if args.until:
+        until = dateparser.parse(args.until)
+        if not until:
+            raise InvalidDateError
+        until = until.date()
+
+    db_events = crud.get_upcoming_events(
+        db,
+        when=datetime.date.today(),
+        until=until,
+        offset=(args.page - 1) * limit,
+        # One extra to know if there is another page
+        limit=limit + 1,
+    )
+    if not db_events:
         return default_responses["NO_EVENTS"]
 
-    return "\n".join([f">{get_formatted_event(event)}" for event in db_events])
+    lines = [f">{get_formatted_event(event)}" for event in db_events[:limit]]
+    if len(db_events) > limit:
+        options = [f"--limit {limit}" if args.limit else "", f"--until {args.until}" if args.until else ""]
+        command = " ".join(["/c upcoming", *filter(None, options), f"--page {args.page + 1}"])
+        lines.append(default_responses["MORE_RESULTS"].format(command))
+
+    return "\n".join(lines)
+
+
+def search_history(args, db: Optional[Session] = None):
+    if (not args.who and not args.what) or args.page < 1:
+        raise UsageError
+
+    db_events = crud.search_events(
+        db,
+        who=args.who,
+        what=args.what,
+        offset=(args.page - 1) * search_page_size,
+        # One extra to know if there is another page
+        limit=search_page_size + 1,
+    )
+    if not db_events:
+        return default_responses["NO_SEARCH_RESULTS"]
+
+    lines = [f">{get_formatted_event(event, with_year=True)}" for event in db_events[:search_page_size]]
+    if len(db_events) > search_page_size:
+        options = [f"--{key} {getattr(args, key)}" for key in ("who", "what") if getattr(args, key)]
+        lines.append(default_responses["MORE_RESULTS"].format(f"/c search {' '.join(options)} --page {args.page + 1}"))
+
+    return "\n".join(lines)
+
+
+def list_stats(args, db: Optional[Session] = None):
+    schedule = stats.get_schedule_stats(db)
+    if not schedule:
+        return default_responses["NO_EVENTS"]
+
+    today = datetime.date.today()
+    lines = ["*Schedule*"]
+    for row in schedule:
+        open_dates = row.dates - row.cancelled
+        fill_rate = row.talks / open_dates if open_dates else 0
+        lines.append(
+            f">{row.event_type or 'other'}: {row.dates} dates, {row.talks} talks, "
+            f"{row.cancelled} cancelled, {fill_rate:.0%} filled"
+        )
+
+    presenters = stats.get_presenter_stats(db)
+    # The counters hold the latest talk, which may be in the future or, after writes around crud,
+    # missing. The last past talk of those presenters is looked up in the events.
+    past_talks = stats.get_last_talks(
+        db, [p.who for p in presenters if p.last_talk is None or p.last_talk > today], until=today
+    )
+    rows = []
+    for presenter in presenters:
+        if presenter.last_talk is not None and presenter.last_talk <= today:
+            rows.append((presenter, presenter.last_talk, None))
+        else:
+            rows.append((presenter, past_talks.get(presenter.who), presenter.last_talk))
+    # Those who never presented, or whose last talk is unknown, first
+    rows.sort(key=lambda row: (row[1] or datetime.date.min, row[0].who))
+
+    lines.append("*Presenters* (longest since last talk first)")
+    for presenter, last_talk, scheduled in rows:
+        parts = [f"{presenter.talks} talks"]
+        if last_talk is not None:
+            parts.append(f"last talk {(today - last_talk).days} days ago")
+        elif scheduled is None:
+            parts.append("last talk unknown")
+        if scheduled is not None:
+            parts.append(f"scheduled for {prettify_date(scheduled, with_year=True)}")
+        lines.append(f">{presenter.who}: {', '.join(parts)}")
+
+    cancellations = stats.get_cancellation_stats(db)
+    if cancellations:
+        lines.append("*Cancellations*")
+        lines.extend(f">{row.reason}: {row.count}" for row in cancellations)
+
+    return "\n".join(lines)
+
+
+def split_message(text: str, max_length: int = max_message_length, max_chunks: Optional[int] = None):
+    """Splits a message into chunks of at most max_length characters, at line breaks where possible.
+
+    If it takes more than max_chunks chunks, the rest is replaced by a note that it was cut off.
+    """
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > max_length:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:max_length])
+            line = line[max_length:]
+
+        if current and len(current) + 1 + len(line) > max_length:
+            chunks.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+
+    chunks.append(current)
+
+    if max_chunks is not None and len(chunks) > max_chunks:
+        chunks = chunks[:max_chunks]
+        note = default_responses["TRUNCATED"]
+        last = chunks[-1][: max_length - len(note) - 1]
+        # Cut at a line break, unless the chunk is a single long line
+        if "\n" in last:
+            last = last[: last.rindex("\n")]
+        chunks[-1] = f"{last}\n{note}"
+
+    return chunks
 
 
 def list_shorthands(args, db: Optional[Session] = None):
-    return "\n".join([f">{c}: `{s}`" for s, c in shorthands.items()])
+    return "\n".join([f">{c}: `{s}`" for s, c in registry.shorthands.items()])
 
 
 def list_help(args, db: Optional[Session] = None):
-    return "\n".join([f"{y['usage']}\n>{y['help_text']}\n" for _, y in commands.items()])
-
-
-def get_unique_shorthand(i: int, key: str, short_keys: str, long_keys: str):
-    """Gets the shortest sub-string of 'key' that is not in either 'long_keys' or 'short_keys'."""
-
-    if i >= len(key):
-        return key
-
-    sh = key[:i]
-
-    if sh in long_keys:
-        return key
-
-    if sh in short_keys or sh in long_keys:
-        return get_unique_shorthand(i + 1, key, short_keys, long_keys)
-
-    return sh
-
-
-commands = {
-    "next": {
-        "command": list_next_event,
-        "help_text": "Displays the next event.",
-        "usage": "`/c next`",
-    },
-    "upcoming": {
-        "command": list_upcoming_events,
-        "help_text": "Lists all planned events.",
-        "usage": "`/c upcoming`",
-    },
-    "schedule": {
-        "command": schedule_new_event,
-        "help_text": (
-            "Lets you schedule a new event. "
-            "The date you pick has to exist and be vacant. "
-            "To add a new date, see the `add` command. "
-            "In order to cancel an event, see the `cancel` command. "
-            "(Pro-tip: you don't have to specify an exact date – `in two weeks` and `13 nov` works just as well!)"
-        ),
-        "usage": "`/c schedule --who <who> --what <what> --when <when>`",
-    },
-    "add": {
-        "command": add_new_date,
-        "help_text": (
-            f"Adds a new (empty) date to the schedule of type <event>. "
-            f"Allowed event types: "
-            f"{', '.join([f'`{x}`' for x in event_types])}"
-        ),
-        "usage": "`/c add --event <event> --when yyyy-mm-dd`",
-    },
-    "remove": {
-        "command": remove_existing_future_date,
-        "help_text": "Removes an existing date from the schedule.",
-        "usage": "`/c remove --when yyyy-mm-dd`",
-    },
-    "help": {"command": list_help, "help_text": "Displays this help text.", "usage": "`/c help`"},
-    "clear": {
-        "command": clear_event,
-        "help_text": "Clears both the current presenter and the topic (`who` and `what`) on the selected date.",
-        "usage": "`/c clear --when yyyy-mm-dd`",
-    },
-    "cancel": {
-        "command": cancel_event,
-        "help_text": "Cancels the event on the specified date.",
-        "usage": "`/c cancel --when yyyy-mm-dd --what <reason>`",
-    },
-    "shorthands": {
-        "command": list_shorthands,
-        "help_text": "Displays shorthand versions of the commands",
-        "usage": "`/c shorthands`",
-    },
-}
+    return "\n".join([f"{c.usage}\n>{c.help_text}\n" for c in registry])
+
+
+def get_invalid_command_response(name: str):
+    suggestions = registry.suggest(name)
+    if suggestions:
+        return default_responses["DID_YOU_MEAN"].format(name, ", ".join(f"`{x}`" for x in suggestions))
+
+    return default_responses["INVALID_COMMAND"]
+
+
+def get_error_response(error: Exception, command: Command):
+    """Looks up the response for an error raised by a command in `error_responses`."""
+    for error_type in type(error).__mro__:
+        if error_type in error_responses:
+            response = error_responses[error_type]
+            return response(command) if callable(response) else default_responses[response]
+
+    raise error
 
-shorthands = {}
-for key in commands:
-    shorthand = get_unique_shorthand(1, key, shorthands, commands)
-    shorthands[shorthand] = key
 
-default_responses["INVALID_COMMAND"] = f"Sorry. Try one of these: *{commands}*."
+registry = CommandRegistry()
+registry.add(
+    "next",
+    list_next_event,
+    help_text="Displays the next event.",
+    usage="`/c next`",
+    read_only=True,
+)
+registry.add(
+    "upcoming",
+    list_upcoming_events,
+    help_text=(
+        "Lists the planned events, a page at a time. "
+        "Use `--limit` to set the number of events per page and `--until` to only show events up to a date."
+    ),
+    usage="`/c upcoming [--limit <limit>] [--until <when>] [--page <page>]`",
+    read_only=True,
+)
+registry.add(
+    "schedule",
+    schedule_new_event,
+    help_text=(
+        "Lets you schedule a new event. "
+        "The date you pick has to exist and be vacant. "
+        "To add a new date, see the `add` command. "
+        "In order to cancel an event, see the `cancel` command. "
+        "(Pro-tip: you don't have to specify an exact date – `in two weeks` and `13 nov` works just as well!)"
+    ),
+    usage="`/c schedule --who <who> --what <what> --when <when>`",
+)
+registry.add(
+    "add",
+    add_new_date,
+    help_text=(
+        f"Adds a new (empty) date to the schedule of type <event>. "
+        f"Allowed event types: "
+        f"{', '.join([f'`{x}`' for x in event_types])}"
+    ),
+    usage="`/c add --event <event> --when yyyy-mm-dd`",
+)
+registry.add(
+    "remove",
+    remove_existing_future_date,
+    help_text="Removes an existing date from the schedule.",
+    usage="`/c remove --when yyyy-mm-dd`",
+)
+registry.add(
+    "search",
+    search_history,
+    help_text=(
+        "Finds past and future events by presenter and/or topic, best match first. "
+        "Use `--page` to see more results."
+    ),
+    usage="`/c search --who <who> --what <what> [--page <page>]`",
+    read_only=True,
+)
+registry.add(
+    "stats",
+    list_stats,
+    help_text=(
+        "Shows the number of talks, cancellations and how many dates are filled, "
+        "and how long it is since each presenter's last talk."
+    ),
+    usage="`/c stats`",
+    read_only=True,
+)
+registry.add(
+    "help",
+    list_help,
+    help_text="Displays this help text.",
+    usage="`/c help`",
+    uses_db=False,
+)
+registry.add(
+    "clear",
+    clear_event,
+    help_text="Clears both the current presenter and the topic (`who` and `what`) on the selected date.",
+    usage="`/c clear --when yyyy-mm-dd`",
+)
+registry.add(
+    "cancel",
+    cancel_event,
+    help_text="Cancels the event on the specified date.",
+    usage="`/c cancel --when yyyy-mm-dd --what <reason>`",
+)
+registry.add(
+    "shorthands",
+    list_shorthands,
+    help_text="Displays shorthand versions of the commands",
+    usage="`/c shorthands`",
+    uses_db=False,
+)
+
+# Errors raised by commands, mapped to a key in `default_responses` or a function of the command
+error_responses = {
+    UsageError: lambda command: f"Usage error: {command.usage}",
+    InvalidDateError: "INVALID_DATE_ERROR",
+    InvalidEventError: "INVALID_EVENT_ERROR",
+    MissingDateError: "MISSING_DATE_ERROR",
+    PastDateError: "PAST_DATE_ERROR",
+    ExistingDateError: "EXISTING_DATE_ERROR",
+    AlreadyScheduledError: "ALREADY_SCHEDULED_ERROR",
+    AlreadyClearedError: "ALREADY_CLEARED_ERROR",
+    AlreadyCancelledError: "ALREADY_CANCELLED_ERROR",
+}
+
+default_responses["INVALID_COMMAND"] = f"Sorry. Try one of these: {', '.join(f'`{c.name}`' for c in registry)}."
@@ -2,10 +2,10 @@ import datetime
 from datetime import date
 from typing import Optional
 
-from sqlalchemy import and_
+from sqlalchemy import and_, func, literal, or_
 from sqlalchemy.orm import Session
 
-from bot_api import models
+from bot_api import models, search, stats
 
 
 def _nearest(items, pivot):
@@ -19,6 +19,7 @@ def _nearest(items, pivot):
 def create_event(db: Session, when: date, event_type: str):
     db_event = models.Event(when=when, event_type=event_type)
     db.add(db_event)
+    stats.record_change(db, None, stats.snapshot(db_event))
     db.commit()
     db.refresh(db_event)
 
@@ -27,15 +28,19 @@ def create_event(db: Session, when: date, event_type: str):
 
 def remove_event(db: Session, when: date):
     db_event = get_event_by_date(db, when)
+    before = stats.snapshot(db_event)
     db.delete(db_event)
+    stats.record_change(db, before, None)
     db.commit()
 
     return db_event
 
 
 def update_event(db: Session, db_event: models.Event, who: Optional[str], what: Optional[str]):
+    before = stats.snapshot(db_event)
     db_event.who = who
     db_event.what = what
+    stats.record_change(db, before, stats.snapshot(db_event))
     db.commit()
 
     return db_event
@@ -66,5 +71,45 @@ def get_closest_event(db: Session, when: date):
     return db_event
 
 
-def get_upcoming_events(db: Session, when: date):
-    return db.query(models.Event).filter(models.Event.when >= when).order_by(models.Event.when).all()
+def get_upcoming_events(
+    db: Session, when: date, until: Optional[date] = None, offset: int = 0, limit: Optional[int] = None
+):
+    query = db.query(models.Event).filter(models.Event.when >= when)
+    if until is not None:
+        query = query.filter(models.Event.when <= until)
+
+    return query.order_by(models.Event.when).offset(offset).limit(limit).all()
+
+
+def search_events(
+    db: Session, who: Optional[str] = None, what: Optional[str] = None, offset: int = 0, limit: int = 10
+):
+    """Finds past and future events by presenter and/or topic, best match first."""
+    if search.is_postgres(db):
+        return _search_events_postgres(db, who=who, what=what, offset=offset, limit=limit)
+
+    dates = search.get_index(db).search(who, what)[offset : offset + limit]
+    if not dates:
+        return []
+
+    db_events = {e.when: e for e in db.query(models.Event).filter(models.Event.when.in_(dates))}
+    return [db_events[when] for when in dates if when in db_events]
+
+
+def _search_events_postgres(db: Session, who: Optional[str], what: Optional[str], offset: int, limit: int):
+    query = db.query(models.Event)
+    rank = literal(0.0)
+    has_terms = False
+
+    for column, value in ((models.Event.who, who), (models.Event.what, what)):
+        for token in search.tokenize(value):
+            # Substring match, or a similar word for typos. Both use the trigram indexes.
+            pattern = "%" + token.replace("_", "\\_") + "%"
+            query = query.filter(or_(column.ilike(pattern, escape="\\"), column.op("%>")(token)))
+            rank = rank + func.word_similarity(token, column)
+            has_terms = True
+
+    if not has_terms:
+        return []
+
+    return query.order_by(rank.desc(), models.Event.when.desc()).offset(offset).limit(limit).all()
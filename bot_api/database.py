@@ -1,10 +1,116 @@
+import contextlib
 import os
+import threading
+import time
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
 
 SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Heroku still hands out postgres:// URLs, which SQLAlchemy no longer accepts
+if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
+    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# Every worker process has its own pool, so keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the connection limit of the database.
+POOL_SETTINGS = {
+    "pool_size": int(os.environ.get("DB_POOL_SIZE", 3)),
+    "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 2)),
+    "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 30 * 60)),
+    "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes", "on"),
+}
+
+if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # SQLite is only used for development, with the default pool
+    engine = create_engine(SQLALCHEMY_DATABASE_URL)
+else:
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **POOL_SETTINGS)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class PoolStats:
+    """Checkout times and connection counts of the connection pool in this process.
+
+    The checkout time is the time a session takes to get its connection: waiting for a free one,
+    opening a new one when the pool is not full, and the pre-ping.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Starts counting from zero, e.g. in a worker forked from a master that used the database."""
+        # A new lock, as a forked child may inherit the old one locked
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_checkout_time += seconds
+            self.max_checkout_time = max(self.max_checkout_time, seconds)
+
+    def record_connect(self, *args):
+        with self._lock:
+            self.connects += 1
+
+    def as_dict(self, pool=None) -> dict:
+        pool = pool if pool is not None else engine.pool
+        with self._lock:
+            data = {
+                "pid": os.getpid(),
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "mean_checkout_ms": 1000 * self.total_checkout_time / self.checkouts if self.checkouts else 0.0,
+                "max_checkout_ms": 1000 * self.max_checkout_time,
+            }
+
+        if isinstance(pool, QueuePool):
+            data.update(
+                size=pool.size(),
+                checked_in=pool.checkedin(),
+                checked_out=pool.checkedout(),
+                # Negative while fewer than `size` connections have been opened
+                overflow=pool.overflow(),
+            )
+
+        return data
+
+
+pool_stats = PoolStats()
+event.listen(engine, "connect", pool_stats.record_connect)
+
+
+@contextlib.contextmanager
+def session_scope(read_only: bool = False):
+    """Yields a session that is committed when the block succeeds, rolled back if not, and always closed.
+
+    Read-only sessions run in autocommit mode, skipping the BEGIN/COMMIT round trips, and are
+    never committed.
+    """
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        if read_only:
+            db.connection(execution_options={"isolation_level": "AUTOCOMMIT"})
+        else:
+            db.connection()
+        pool_stats.record_checkout(time.perf_counter() - start)
+
+        yield db
+
+        if not read_only:
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
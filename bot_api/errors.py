@@ -36,3 +36,7 @@ class ExistingDateError(Exception):
 
 class ArgumentError(Exception):
     pass
+
+
+class EventQueueFullError(Exception):
+    pass
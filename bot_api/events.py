@@ -0,0 +1,139 @@
+"""Dispatching of Slack Events API callbacks.
+
+Slack retries an event that is not acknowledged within three seconds, so the endpoint only
+queues the event and returns. Events are de-duplicated on their `event_id` and handed to the
+handlers registered for their type, which run on a bounded pool of asyncio workers. Blocking
+handlers (plain functions) run in the default thread pool executor.
+"""
+import asyncio
+import collections
+import inspect
+import logging
+import time
+from typing import Callable, Dict, List, Optional
+
+from bot_api.errors import EventQueueFullError
+
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Bounded set of keys that expire after `ttl` seconds."""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60 * 10, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._items = collections.OrderedDict()
+
+    def _expire(self, now: float):
+        while self._items:
+            key, expires = next(iter(self._items.items()))
+            if expires > now and len(self._items) <= self.maxsize:
+                break
+            del self._items[key]
+
+    def add(self, key) -> bool:
+        """Adds the key, returning False if it was already present."""
+        now = self.clock()
+        self._expire(now)
+        if key in self._items:
+            return False
+
+        self._items[key] = now + self.ttl
+        self._expire(now)
+        return True
+
+    def __contains__(self, key) -> bool:
+        self._expire(self.clock())
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class EventDispatcher:
+    def __init__(self, workers: int = 4, queue_size: int = 100, dedup_cache: Optional[TTLCache] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.seen = dedup_cache if dedup_cache is not None else TTLCache()
+        self.handlers: Dict[str, List[Callable]] = collections.defaultdict(list)
+        self._queue = None
+        self._tasks = []
+
+    def register(self, event_type: str):
+        """Decorator registering a handler for an event type, e.g. `app_mention`."""
+
+        def decorator(handler):
+            self.handlers[event_type].append(handler)
+            return handler
+
+        return decorator
+
+    def _start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            handler, event = await self._queue.get()
+            try:
+                if inspect.iscoroutinefunction(handler):
+                    await handler(event)
+                else:
+                    await loop.run_in_executor(None, handler, event)
+            except Exception:
+                logger.exception(f"Handler {handler.__name__} failed for event {event.get('type')}")
+            finally:
+                self._queue.task_done()
+
+    def dispatch(self, payload: dict, retry_num=None) -> bool:
+        """Queues an `event_callback` payload for its handlers without waiting for them.
+
+        Returns False if the event was a duplicate or had no handlers. Raises EventQueueFullError,
+        without queuing it for any handler, if there is no room for the event.
+        Must be called from within the running event loop.
+        """
+        event = payload.get("event") or {}
+        event_id = payload.get("event_id")
+
+        if event_id and event_id in self.seen:
+            logger.info(f"Ignoring duplicate event {event_id} (retry {retry_num})")
+            return False
+
+        handlers = self.handlers.get(event.get("type"))
+        if not handlers:
+            return False
+
+        if self._queue is None:
+            self._start()
+
+        # All handlers or none, so that Slack's retry does not run some of them twice
+        if self.queue_size > 0 and self._queue.qsize() + len(handlers) > self.queue_size:
+            logger.warning(f"Event queue full, dropping event {event_id} (retry {retry_num})")
+            raise EventQueueFullError(event_id)
+
+        if event_id:
+            self.seen.add(event_id)
+        for handler in handlers:
+            self._queue.put_nowait((handler, event))
+
+        return True
+
+    async def shutdown(self, timeout: float = 10):
+        """Waits up to `timeout` seconds for queued events, then stops the workers."""
+        if self._queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self._queue.qsize()} unhandled events")
+
+        for task in self._tasks:
+            task.cancel()
+
+        self._queue = None
+        self._tasks = []
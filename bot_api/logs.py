@@ -0,0 +1,166 @@
+"""Queue-based logging.
+
+Log records are put on a bounded in-memory queue and written by a background thread, so request
+handlers never wait on disk I/O. Records are formatted as compact JSON lines and appended to the
+log file, which several worker processes may share. Rotate it externally (e.g. with logrotate),
+the file is reopened when it is moved.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from typing import Dict
+
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single JSON line, including any fields passed through `extra`."""
+
+    def format(self, record):
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES)
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+
+        return json.dumps(data, default=str, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text formatter that appends fields passed through `extra` as compact JSON."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        extra = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES}
+        if extra:
+            line = f"{line} {json.dumps(extra, default=str, separators=(',', ':'))}"
+
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking or raising when the queue is full."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Leave formatting, including serializing `extra` payloads, to the background thread.
+        # Only the message arguments are resolved here, as they may be mutated after the call.
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+
+class _QueuePipeline:
+    """A queue handler on a logger and the background listener writing its records to `target`."""
+
+    def __init__(self, logger: logging.Logger, target: logging.Handler, queue_size: int):
+        self.logger = logger
+        self.target = target
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.listener = None
+        self.start()
+        logger.addHandler(self.handler)
+
+    def start(self):
+        self.handler.queue = queue.Queue(maxsize=self.handler.queue.maxsize)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        self.listener.stop()
+        self.logger.removeHandler(self.handler)
+        self.target.close()
+
+
+# Keyed on logger name, "" being the root logger
+_pipelines: Dict[str, _QueuePipeline] = {}
+
+
+def _restart_listeners_after_fork():
+    # The listener threads do not survive a fork, e.g. into gunicorn workers of a preloaded app
+    for pipeline in _pipelines.values():
+        pipeline.start()
+
+
+def _install(name: str, target: logging.Handler, queue_size: int) -> DroppingQueueHandler:
+    stop_logging(name)
+    _pipelines[name] = _QueuePipeline(logging.getLogger(name), target, queue_size)
+    return _pipelines[name].handler
+
+
+def setup_logging(
+    filename=None,
+    level=logging.INFO,
+    fmt: str = "json",
+    queue_size: int = 10000,
+):
+    """Routes the root logger through a queue to a file, or to stderr if no filename is given."""
+    if filename:
+        target = logging.handlers.WatchedFileHandler(filename)
+    else:
+        target = logging.StreamHandler()
+    target.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+    logging.getLogger().setLevel(level)
+    return _install("", target, queue_size)
+
+
+def setup_file_logger(name: str, filename: str, formatter: logging.Formatter, queue_size: int = 10000):
+    """Routes a logger, and only that logger, through a queue to a file that is appended to."""
+    target = logging.FileHandler(filename)
+    target.setFormatter(formatter)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return _install(name, target, queue_size)
+
+
+def stop_logging(name: str = ""):
+    """Flushes the queue of a logger set up here and removes its queue handler."""
+    pipeline = _pipelines.pop(name, None)
+    if pipeline is not None:
+        pipeline.stop()
+
+
+def _stop_all():
+    for name in list(_pipelines):
+        stop_logging(name)
+
+
+def sample(rate: float) -> bool:
+    """Returns True for roughly `rate` of all calls."""
+    return rate >= 1 or random.random() < rate
+
+
+atexit.register(_stop_all)
+os.register_at_fork(after_in_child=_restart_listeners_after_fork)
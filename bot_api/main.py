@@ -1,39 +1,48 @@
 import json
 import os
+import re
 import time
 import hmac
 import hashlib
 import datetime
 import logging
+from typing import Optional
 
 import requests
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Response, Depends, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from bot_api import crud, commands, models
-from bot_api.database import engine, SessionLocal
-from bot_api.errors import (
-    AlreadyCancelledError,
-    AlreadyClearedError,
-    AlreadyScheduledError,
-    ArgumentError,
-    ExistingDateError,
-    InvalidDateError,
-    InvalidEventError,
-    MissingDateError,
-    PastDateError,
-    UsageError,
-)
+from bot_api import capture, crud, commands, logs, models, profiling, schemas, search, stats
+from bot_api.database import engine, pool_stats, session_scope
+from bot_api.events import EventDispatcher, TTLCache
+from bot_api.ratelimit import make_concurrency_limiter, make_limiter
+from bot_api.errors import ArgumentError, EventQueueFullError
 
 
-models.Base.metadata.create_all(bind=engine)
+LOG_FILE = os.environ.get("BOT_LOG_FILE")
+LOG_FORMAT = os.environ.get("BOT_LOG_FORMAT", "json")
+EVENT_LOG_SAMPLE_RATE = float(os.environ.get("BOT_EVENT_LOG_SAMPLE_RATE", "1"))
 
 app = FastAPI(use_reloader=False)
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO, filename="/home/c-bot/bot_log.log", filemode="w")
+
+# Records anonymized Slack traffic for scripts/replay.py
+if capture.CAPTURE_FILE:
+    app.add_middleware(capture.CaptureMiddleware, filename=capture.CAPTURE_FILE)
+
+logs.setup_logging(
+    # Logs to stderr unless BOT_LOG_FILE is set
+    filename=LOG_FILE or None,
+    level=os.environ.get("BOT_LOG_LEVEL", "INFO"),
+    fmt=LOG_FORMAT,
+)
 
 POST_MESSAGE_URL = "https://slack.com/api/chat.postMessage"
+POST_EPHEMERAL_URL = "https://slack.com/api/chat.postEphemeral"
+# Slack accepts at most five messages to a response_url
+MAX_FOLLOW_UPS = 5
 SET_TOPIC_URL = "https://slack.com/api/conversations.setTopic"
 CHANNEL_INFO_URL = "https://slack.com/api/conversations.info"
 
@@ -47,14 +56,38 @@ SLACK_BOT_OAUTH_TOKEN = os.environ.get("SLACK_BOT_OAUTH_TOKEN")
 SLACK_USER_TOKEN = os.environ.get("SLACK_USER_TOKEN")
 SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET")
 
+# Mentions look like "<@U012AB3CD> next"
+MENTION_PATTERN = re.compile(r"^\s*<@\w+>\s*")
+
+user_limiter = make_limiter(
+    per_minute=float(os.environ.get("BOT_USER_RATE_LIMIT", 20)),
+    burst=float(os.environ.get("BOT_USER_BURST", 5)),
+    redis_url=os.environ.get("BOT_RATE_LIMIT_REDIS_URL"),
+)
+channel_limiter = make_limiter(
+    per_minute=float(os.environ.get("BOT_CHANNEL_RATE_LIMIT", 60)),
+    burst=float(os.environ.get("BOT_CHANNEL_BURST", 15)),
+    redis_url=os.environ.get("BOT_RATE_LIMIT_REDIS_URL"),
+)
+# Commands using the database wait at most BOT_DB_WAIT seconds for one of BOT_DB_CONCURRENCY slots,
+# per worker, or shared by all workers with BOT_DB_CONCURRENCY_REDIS_URL
+db_limiter = make_concurrency_limiter(
+    limit=int(os.environ.get("BOT_DB_CONCURRENCY", 4)),
+    timeout=float(os.environ.get("BOT_DB_WAIT", 1)),
+    redis_url=os.environ.get("BOT_DB_CONCURRENCY_REDIS_URL"),
+)
+
+dispatcher = EventDispatcher(
+    workers=int(os.environ.get("BOT_EVENT_WORKERS", 4)),
+    queue_size=int(os.environ.get("BOT_EVENT_QUEUE_SIZE", 100)),
+    dedup_cache=TTLCache(ttl=int(os.environ.get("BOT_EVENT_DEDUP_TTL", 60 * 10))),
+)
+
 
 # Dependency
-def get_db():
-    try:
-        db = SessionLocal()
+def get_read_only_db():
+    with session_scope(read_only=True) as db:
         yield db
-    finally:
-        db.close()
 
 
 def validate_request(request_body, timestamp, slack_signature):
@@ -89,7 +122,11 @@ def ping_server():
 
 
 def post_msg_if_no_presenter():
-    db = SessionLocal()
+    with session_scope(read_only=True) as db:
+        return _post_msg_if_no_presenter(db)
+
+
+def _post_msg_if_no_presenter(db: Session):
     db_event = crud.get_closest_event(db, when=datetime.date.today())
     if db_event is None:
         return
@@ -108,7 +145,7 @@ def post_msg_if_no_presenter():
     td = db_event.when - now
     if db_event.who:
         if td < datetime.timedelta(days=7):
-            message["text"] = commands.list_next_event(None)
+            message["text"] = commands.list_next_event(None, db)
             return requests.post(POST_MESSAGE_URL, data=message)
         return
 
@@ -129,12 +166,15 @@ def post_msg_if_no_presenter():
         commands.prettify_date(db_event.when), "tonight"
     )
 
-    db.close()
     return requests.post(POST_MESSAGE_URL, data=message)
 
 
 def set_new_topic_if_not_set():
-    db = SessionLocal()
+    with session_scope(read_only=True) as db:
+        return _set_new_topic_if_not_set(db)
+
+
+def _set_new_topic_if_not_set(db: Session):
     db_event = crud.get_closest_event(db, when=datetime.date.today())
     if db_event is None:
         return
@@ -162,22 +202,72 @@ async def ping():
     return 200
 
 
+@app.get("/api/v1.0/pool")
+async def pool():
+    """Connection pool statistics of the worker answering the request"""
+    return pool_stats.as_dict()
+
+
 @app.post("/api/v1.0/events")
 async def events(request: Request):
-    req = await request.json()
-    logger.info(json.dumps(req, sort_keys=True, indent=4))
+    """Endpoint for the Slack Events API. Events are acknowledged right away and handled in the background."""
+    timestamp = request.headers.get("X-Slack-Request-Timestamp")
+    slack_signature = request.headers.get("X-Slack-Signature")
+
+    request_body = await request.body()
+    if not validate_request(request_body, timestamp, slack_signature):
+        return {"text": "Invalid request."}
+
+    req = json.loads(request_body)
+    if logs.sample(EVENT_LOG_SAMPLE_RATE):
+        # Serialized by the logging thread
+        logger.info("Received event", extra={"payload": req})
     if "challenge" in req:
         return {"challenge": req["challenge"]}
 
+    if req.get("type") == "event_callback":
+        try:
+            dispatcher.dispatch(req, retry_num=request.headers.get("X-Slack-Retry-Num"))
+        except EventQueueFullError:
+            # Slack retries events that are not acknowledged with a 2xx response
+            return Response(status_code=503)
+
 
 @app.post("/api/v1.0/upcoming")
-async def upcoming(db: Session = Depends(get_db)):
+async def upcoming(db: Session = Depends(get_read_only_db)):
     """Endpoint for the /upcoming command"""
-    return {"text": commands.commands["upcoming"]["command"](None, db), "response_type": "ephemeral"}
+    args = commands.get_args_from_request("upcoming")
+    return {"text": commands.registry["upcoming"].command(args, db), "response_type": "ephemeral"}
+
+
+@app.get("/api/v1.0/search", response_model=schemas.SearchResult)
+def search_events(
+    who: Optional[str] = None,
+    what: Optional[str] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(commands.search_page_size, ge=1, le=100),
+):
+    """Finds past and future events by presenter and/or topic, best match first.
+
+    Public like the schedule itself, but all callers share one rate limit bucket and the database slots of the bot.
+    """
+    if not channel_limiter.allow("api:search"):
+        return Response(status_code=429)
+
+    lease = db_limiter.acquire()
+    if not lease:
+        return Response(status_code=503)
+
+    try:
+        with session_scope(read_only=True) as db:
+            db_events = crud.search_events(db, who=who, what=what, offset=(page - 1) * page_size, limit=page_size + 1)
+            return {"events": db_events[:page_size], "page": page, "has_more": len(db_events) > page_size}
+    finally:
+        db_limiter.release(lease)
 
 
 @app.post("/api/v1.0/command")
-async def command(request: Request, db: Session = Depends(get_db)):
+async def command(request: Request, background_tasks: BackgroundTasks):
     """Endpoint for general bot commands"""
 
     timestamp = request.headers.get("X-Slack-Request-Timestamp")
@@ -193,45 +283,131 @@ async def command(request: Request, db: Session = Depends(get_db)):
     if not validate_request(request_body, timestamp, slack_signature):
         return {"text": "Invalid request."}
 
+    if not is_within_rate_limit(form.get("user_id"), form.get("channel_id")):
+        return {"text": commands.default_responses["RATE_LIMITED"], "response_type": "ephemeral"}
+
+    # Run in a thread, so a slow command does not block the event loop
+    response = await run_in_threadpool(handle_profiled_command, text, request.headers)
+
+    # Long responses are answered with the first chunk, the rest follow through the response_url
+    response_url = form.get("response_url")
+    chunks = commands.split_message(response["text"], max_chunks=1 + MAX_FOLLOW_UPS if response_url else 1)
+    if len(chunks) > 1:
+        background_tasks.add_task(post_follow_ups, response_url, chunks[1:], response["response_type"])
+
+    return {**response, "text": chunks[0]}
+
+
+def post_follow_ups(response_url: str, chunks, response_type: str):
+    for chunk in chunks:
+        requests.post(response_url, json={"text": chunk, "response_type": response_type})
+
+
+def is_within_rate_limit(user_id, channel_id) -> bool:
+    if not user_limiter.allow(f"user:{user_id}"):
+        return False
+
+    if not channel_limiter.allow(f"channel:{channel_id}"):
+        # A command rejected for its channel does not count against the user
+        user_limiter.refund(f"user:{user_id}")
+        return False
+
+    return True
+
+
+def handle_profiled_command(text: str, headers):
+    with profiling.maybe_profile(headers, label=text.strip().partition(" ")[0]):
+        return handle_command(text)
+
+
+def handle_command(text: str):
+    """Parses and runs a bot command in its own database session, returning the Slack response"""
     try:
         args = commands.get_args_from_request(text)
     except ArgumentError as e:
         return {"text": str(e), "response_type": "ephemeral"}
 
-    # Switch a potential shorthand with the corresponding command
-    cmd = commands.shorthands.get(args.command, args.command)
+    cmd = commands.registry.resolve(args.command)
+    if cmd is None:
+        return {"text": commands.get_invalid_command_response(args.command), "response_type": "ephemeral"}
+
+    lease = db_limiter.acquire() if cmd.uses_db else None
+    if cmd.uses_db and not lease:
+        return {"text": commands.default_responses["BUSY"], "response_type": "ephemeral"}
 
     was_raised = True
     try:
-        response = commands.commands[cmd]["command"](args, db)
+        if cmd.uses_db:
+            with session_scope(read_only=cmd.read_only) as db:
+                response = cmd.command(args, db)
+        else:
+            response = cmd.command(args, None)
         was_raised = False
-    except KeyError:
-        response = commands.default_responses["INVALID_COMMAND"]
-    except UsageError:
-        response = f"Usage error: {commands.commands[cmd]['usage']}"
-    except InvalidDateError:
-        response = commands.default_responses["INVALID_DATE_ERROR"]
-    except InvalidEventError:
-        response = commands.default_responses["INVALID_EVENT_ERROR"]
-    except MissingDateError:
-        response = commands.default_responses["MISSING_DATE_ERROR"]
-    except PastDateError:
-        response = commands.default_responses["PAST_DATE_ERROR"]
-    except ExistingDateError:
-        response = commands.default_responses["EXISTING_DATE_ERROR"]
-    except AlreadyScheduledError:
-        response = commands.default_responses["ALREADY_SCHEDULED_ERROR"]
-    except AlreadyClearedError:
-        response = commands.default_responses["ALREADY_CLEARED_ERROR"]
-    except AlreadyCancelledError:
-        response = commands.default_responses["ALREADY_CANCELLED_ERROR"]
+    except tuple(commands.error_responses) as e:
+        response = commands.get_error_response(e, cmd)
+    finally:
+        if cmd.uses_db:
+            db_limiter.release(lease)
 
     response_type = "ephemeral" if args.silent or was_raised else "in_channel"
     return {"text": response, "response_type": response_type}
 
 
+@dispatcher.register("app_mention")
+def reply_to_mention(event):
+    """Runs the text following a mention of the bot as a command and replies in the channel"""
+    if event.get("bot_id"):
+        return
+
+    text = MENTION_PATTERN.sub("", event.get("text", "")) or "help"
+    if is_within_rate_limit(event.get("user"), event.get("channel")):
+        response = handle_command(text)
+    else:
+        response = {"text": commands.default_responses["RATE_LIMITED"], "response_type": "ephemeral"}
+
+    message = {
+        "channel": event["channel"],
+        "token": SLACK_BOT_OAUTH_TOKEN,
+    }
+
+    url = POST_MESSAGE_URL
+    if response["response_type"] == "ephemeral":
+        message["user"] = event["user"]
+        url = POST_EPHEMERAL_URL
+
+    for chunk in commands.split_message(response["text"], max_chunks=1 + MAX_FOLLOW_UPS):
+        requests.post(url, data={**message, "text": chunk})
+
+
 sched = BackgroundScheduler(timezone="Europe/Oslo")
 # sched.add_job(ping_server, trigger="cron", minute="*/5")
 sched.add_job(post_msg_if_no_presenter, trigger="cron", day_of_week=3, hour=12)
 sched.add_job(set_new_topic_if_not_set, trigger="cron", day="*", hour="*/10", minute=30)
-sched.start()
+
+
+def init_app():
+    """Creates the tables and starts the scheduler.
+
+    Kept out of import time so that gunicorn can preload the app without every worker
+    inheriting open database connections and running its own copy of the scheduled jobs.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    search.create_indexes(engine)
+
+    with session_scope() as db:
+        stats.rebuild_if_empty(db)
+
+    if not sched.running:
+        sched.start()
+
+
+@app.on_event("startup")
+def startup():
+    # Already done by the gunicorn master when the app is preloaded, see bot_api.server
+    if os.environ.get("BOT_API_INITIALIZED") != "1":
+        init_app()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await dispatcher.shutdown()
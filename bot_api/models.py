@@ -11,3 +11,29 @@ class Event(Base):
     event_type = Column("event_type", String)
     who = Column("who", String)
     what = Column("what", String)
+
+
+class PresenterStats(Base):
+    """Talks per presenter, kept up to date by the crud write functions. See bot_api.stats."""
+
+    __tablename__ = "presenter_stats"
+
+    who = Column("who", String, primary_key=True)
+    talks = Column("talks", Integer, nullable=False, default=0)
+    last_talk = Column("last_talk", Date)
+
+
+class CancellationStats(Base):
+    __tablename__ = "cancellation_stats"
+
+    reason = Column("reason", String, primary_key=True)
+    count = Column("count", Integer, nullable=False, default=0)
+
+
+class ScheduleStats(Base):
+    __tablename__ = "schedule_stats"
+
+    event_type = Column("event_type", String, primary_key=True)
+    dates = Column("dates", Integer, nullable=False, default=0)
+    talks = Column("talks", Integer, nullable=False, default=0)
+    cancelled = Column("cancelled", Integer, nullable=False, default=0)
@@ -0,0 +1,120 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when it carries a valid signed `X-Bot-Profile` header, or when it is
+picked by the `BOT_PROFILE_SAMPLE_RATE` sampling rate. Profiles are written to a bounded ring of
+files in `BOT_PROFILE_DIR`, and a summary of the hottest functions is logged. When neither
+`BOT_PROFILE_SECRET` nor a sampling rate is set, `maybe_profile` returns a shared no-op context.
+
+Create a header value with
+    BOT_PROFILE_SECRET=... python -m bot_api.profiling
+"""
+import contextlib
+import cProfile
+import hashlib
+import hmac
+import io
+import logging
+import os
+import pstats
+import random
+import time
+
+
+PROFILE_HEADER = "X-Bot-Profile"
+PROFILE_SECRET = os.environ.get("BOT_PROFILE_SECRET")
+PROFILE_SAMPLE_RATE = float(os.environ.get("BOT_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("BOT_PROFILE_DIR", "/tmp/bot_profiles")
+PROFILE_KEEP = int(os.environ.get("BOT_PROFILE_KEEP", "20"))
+PROFILE_TOP = 5
+
+ENABLED = bool(PROFILE_SECRET) or PROFILE_SAMPLE_RATE > 0
+
+logger = logging.getLogger(__name__)
+
+_disabled = contextlib.nullcontext()
+
+
+def sign(timestamp: int, secret: str) -> str:
+    """Returns the header value that enables profiling of a request sent at `timestamp`."""
+    digest = hmac.new(secret.encode("utf-8"), f"profile:{timestamp}".encode("utf-8"), hashlib.sha256).hexdigest()
+    return f"{timestamp}:{digest}"
+
+
+def has_valid_signature(value, secret, max_age: int = 60 * 5) -> bool:
+    if not value or not secret:
+        return False
+
+    timestamp, _, _ = value.partition(":")
+    if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > max_age:
+        return False
+
+    return hmac.compare_digest(sign(int(timestamp), secret), value)
+
+
+def should_profile(headers) -> bool:
+    if has_valid_signature(headers.get(PROFILE_HEADER), PROFILE_SECRET):
+        return True
+
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def summarize(profiler: cProfile.Profile, top: int = PROFILE_TOP) -> str:
+    """Returns the `top` functions by own time as a single line."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:top]
+
+    return ", ".join(
+        f"{name} ({os.path.basename(filename)}:{line}) {tottime * 1000:.1f}ms"
+        for (filename, line, name), (_, _, tottime, _, _) in entries
+    )
+
+
+def write_profile(profiler: cProfile.Profile, label: str, directory: str = None, keep: int = None) -> str:
+    """Dumps the profile to `directory`, keeping only the `keep` most recent files."""
+    directory = directory or PROFILE_DIR
+    keep = keep or PROFILE_KEEP
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, f"{time.time_ns()}-{os.getpid()}-{label}.prof")
+    profiler.dump_stats(path)
+
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".prof"))
+    for old in files[:-keep]:
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(directory, old))
+
+    return path
+
+
+@contextlib.contextmanager
+def _profile(label: str):
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        elapsed = (time.perf_counter() - start) * 1000
+        try:
+            path = write_profile(profiler, label)
+        except OSError as e:
+            path = f"<not written: {e}>"
+        logger.info(f"Profiled {label} in {elapsed:.1f}ms, wrote {path}, top: {summarize(profiler)}")
+
+
+def maybe_profile(headers, label: str):
+    """Profiles the enclosed block if the request asks for it or is sampled."""
+    if not ENABLED or not should_profile(headers):
+        return _disabled
+
+    # The label ends up in a file name
+    label = "".join(c for c in label if c.isalnum() or c in "-_")[:32] or "request"
+    return _profile(label)
+
+
+if __name__ == "__main__":
+    if not PROFILE_SECRET:
+        raise SystemExit("BOT_PROFILE_SECRET must be set")
+
+    print(f"{PROFILE_HEADER}: {sign(int(time.time()), PROFILE_SECRET)}")
@@ -0,0 +1,228 @@
+"""Token bucket rate limiting of bot commands.
+
+Every key (e.g. a Slack user or channel) gets a bucket holding up to `capacity` tokens, refilled
+at `rate` tokens per second. A command takes one token, and is rejected when the bucket is empty.
+
+Buckets are kept in memory per process by default. Set a Redis URL to share them between workers;
+this needs the `redis` package. Concurrency limits can be shared through Redis the same way.
+"""
+import collections
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucketLimiter:
+    def __init__(
+        self, rate: float, capacity: float, max_keys: int = 10000, clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key) -> bool:
+        """Takes a token from the bucket of `key`, returning False if it is empty."""
+        if self.rate <= 0:
+            return True
+
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            # Least recently used keys are forgotten first, which at worst gives them a full bucket
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed
+
+    def refund(self, key):
+        """Gives back a token taken by `allow`, e.g. when the command was rejected by another limiter."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(self.capacity, tokens + 1), updated)
+
+
+_REDIS_TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated", now)
+redis.call("EXPIRE", KEYS[1], math.ceil(capacity / rate) + 1)
+return allowed
+"""
+
+_REDIS_REFUND = """
+local tokens = tonumber(redis.call("HGET", KEYS[1], "tokens"))
+if tokens then
+    redis.call("HSET", KEYS[1], "tokens", math.min(tonumber(ARGV[1]), tokens + 1))
+end
+"""
+
+
+class RedisTokenBucketLimiter:
+    """Token bucket limiter with the buckets stored in Redis, shared by all workers."""
+
+    def __init__(self, url: str, rate: float, capacity: float, prefix: str = "bot_api:ratelimit:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required to share rate limits between workers")
+
+        self.rate = rate
+        self.capacity = capacity
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TOKEN_BUCKET)
+        self._refund_script = self._client.register_script(_REDIS_REFUND)
+
+    def allow(self, key) -> bool:
+        if self.rate <= 0:
+            return True
+
+        try:
+            return bool(self._script(keys=[f"{self.prefix}{key}"], args=[self.rate, self.capacity, time.time()]))
+        except Exception:
+            # Rather let commands through than take the bot down with Redis
+            logger.exception("Rate limiting with Redis failed")
+            return True
+
+    def refund(self, key):
+        if self.rate <= 0:
+            return
+
+        try:
+            self._refund_script(keys=[f"{self.prefix}{key}"], args=[self.capacity])
+        except Exception:
+            logger.exception("Refunding a rate limit token in Redis failed")
+
+
+def make_limiter(per_minute: float, burst: float, redis_url: Optional[str] = None):
+    """Creates a limiter allowing `burst` commands at once and `per_minute` commands per minute on average."""
+    if redis_url:
+        return RedisTokenBucketLimiter(redis_url, rate=per_minute / 60, capacity=burst)
+
+    return TokenBucketLimiter(rate=per_minute / 60, capacity=burst)
+
+
+class ConcurrencyLimiter:
+    """Caps the number of concurrent callers in this process, letting the others wait for at most `timeout` seconds."""
+
+    def __init__(self, limit: int, timeout: float = 1.0):
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(limit) if limit > 0 else None
+
+    def acquire(self):
+        """Returns a lease to pass to `release`, or None if no slot became free in time."""
+        if self._semaphore is None:
+            return True
+
+        return True if self._semaphore.acquire(timeout=self.timeout) else None
+
+    def release(self, lease):
+        if self._semaphore is not None and lease:
+            self._semaphore.release()
+
+
+_REDIS_ACQUIRE = """
+local limit = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local lease_time = tonumber(ARGV[3])
+redis.call("ZREMRANGEBYSCORE", KEYS[1], "-inf", now - lease_time)
+if redis.call("ZCARD", KEYS[1]) < limit then
+    redis.call("ZADD", KEYS[1], now, ARGV[4])
+    redis.call("EXPIRE", KEYS[1], math.ceil(lease_time) + 1)
+    return 1
+end
+return 0
+"""
+
+
+class RedisConcurrencyLimiter:
+    """Caps the number of concurrent callers across all workers sharing a Redis instance.
+
+    Slots are held for at most `lease_time` seconds, so that a worker that dies while holding one
+    does not take it with it.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        limit: int,
+        timeout: float = 1.0,
+        lease_time: float = 60,
+        poll_interval: float = 0.02,
+        key: str = "bot_api:concurrency:db",
+    ):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis package is required to share concurrency limits between workers")
+
+        self.limit = limit
+        self.timeout = timeout
+        self.lease_time = lease_time
+        self.poll_interval = poll_interval
+        self.key = key
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_ACQUIRE)
+
+    def acquire(self):
+        if self.limit <= 0:
+            return True
+
+        lease = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                if self._script(keys=[self.key], args=[self.limit, time.time(), self.lease_time, lease]):
+                    return lease
+            except Exception:
+                # Rather let commands through than take the bot down with Redis
+                logger.exception("Acquiring a slot in Redis failed")
+                return lease
+
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def release(self, lease):
+        if self.limit <= 0 or not lease:
+            return
+
+        try:
+            self._client.zrem(self.key, lease)
+        except Exception:
+            logger.exception("Releasing a slot in Redis failed")
+
+
+def make_concurrency_limiter(limit: int, timeout: float, redis_url: Optional[str] = None):
+    """Creates a limiter allowing `limit` concurrent callers per process, or in total if a Redis URL is given."""
+    if redis_url:
+        return RedisConcurrencyLimiter(redis_url, limit=limit, timeout=timeout)
+
+    return ConcurrencyLimiter(limit=limit, timeout=timeout)
@@ -0,0 +1,126 @@
+"""Registry resolving bot command names, shorthands and prefixes.
+
+Commands are registered once at import. Every registration recompiles the shorthands and a
+prefix trie, so resolving a name is a dictionary lookup or a walk down the trie, proportional to
+the length of the input.
+"""
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class Command:
+    name: str
+    command: Callable
+    help_text: str
+    usage: str
+    uses_db: bool = True
+    # Read-only commands run in a lighter, autocommit session
+    read_only: bool = False
+
+
+class _TrieNode:
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        # Names of all commands below this node
+        self.names = []
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Levenshtein distance between a and b, or max_distance + 1 if it is larger than max_distance."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return min(previous[-1], max_distance + 1)
+
+
+class CommandRegistry:
+    def __init__(self):
+        self.commands: Dict[str, Command] = {}
+        self.shorthands: Dict[str, str] = {}
+        self._aliases: Dict[str, str] = {}
+        self._trie = _TrieNode()
+
+    def add(
+        self,
+        name: str,
+        command: Callable,
+        help_text: str,
+        usage: str,
+        uses_db: bool = True,
+        read_only: bool = False,
+    ):
+        self.commands[name] = Command(name, command, help_text, usage, uses_db, read_only)
+        self._compile()
+        return command
+
+    def register(self, name: str, help_text: str, usage: str, uses_db: bool = True, read_only: bool = False):
+        """Decorator registering a command function under `name`."""
+
+        def decorator(command):
+            return self.add(name, command, help_text, usage, uses_db, read_only)
+
+        return decorator
+
+    def _compile(self):
+        # Shorthands are assigned in registration order: the shortest prefix that is not
+        # already taken and is not the name of another command.
+        self.shorthands = {}
+        for name in self.commands:
+            shorthand = next(
+                (
+                    name[:i]
+                    for i in range(1, len(name))
+                    if name[:i] not in self.shorthands and name[:i] not in self.commands
+                ),
+                name,
+            )
+            self.shorthands[shorthand] = name
+
+        self._aliases = {**self.shorthands, **{name: name for name in self.commands}}
+
+        self._trie = _TrieNode()
+        for name in self.commands:
+            node = self._trie
+            for char in name:
+                node = node.children.setdefault(char, _TrieNode())
+                node.names.append(name)
+
+    def resolve(self, name: str) -> Optional[Command]:
+        """Returns the command with this name or shorthand, or the only command starting with it."""
+        if name in self._aliases:
+            return self.commands[self._aliases[name]]
+
+        node = self._trie
+        for char in name:
+            node = node.children.get(char)
+            if node is None:
+                return None
+
+        if len(node.names) == 1:
+            return self.commands[node.names[0]]
+
+        return None
+
+    def suggest(self, name: str, max_distance: int = 2, limit: int = 3) -> List[str]:
+        """Returns the names of the commands closest to a mistyped name."""
+        distances = [(edit_distance(name, other, max_distance), other) for other in self.commands]
+        return [other for distance, other in sorted(distances) if distance <= max_distance][:limit]
+
+    def __getitem__(self, name: str) -> Command:
+        return self.commands[name]
+
+    def __iter__(self):
+        return iter(self.commands.values())
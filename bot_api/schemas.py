@@ -19,3 +19,9 @@ class Event(EventBase):
 
     class Config:
         orm_mode = True
+
+
+class SearchResult(BaseModel):
+    events: List[Event]
+    page: int
+    has_more: bool
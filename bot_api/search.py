@@ -0,0 +1,134 @@
+"""Text search over past and future events.
+
+On PostgreSQL the search runs in the database on `pg_trgm` trigram indexes of the `who` and
+`what` columns, see `create_indexes`. Other databases (i.e. SQLite when developing) use an
+in-memory inverted index, rebuilt when events are written or when it is older than
+`INDEX_MAX_AGE` seconds (writes from other processes are not seen before that).
+"""
+import bisect
+import collections
+import logging
+import math
+import re
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from bot_api import models
+
+
+INDEX_MAX_AGE = 60
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    return re.findall(r"\w+", value.casefold()) if value else []
+
+
+class InvertedIndex:
+    """Maps the words of a text field to the keys of the rows containing them."""
+
+    def __init__(self):
+        self.postings: Dict[str, set] = collections.defaultdict(set)
+        self._terms: List[str] = []
+        self._size = 0
+
+    def add(self, key, value: Optional[str]):
+        self._size += 1
+        for term in tokenize(value):
+            self.postings[term].add(key)
+
+    def freeze(self):
+        """Sorts the terms for prefix lookups. Call after adding all rows."""
+        self._terms = sorted(self.postings)
+
+    def _expand(self, token: str):
+        """Yields the indexed terms starting with token."""
+        i = bisect.bisect_left(self._terms, token)
+        while i < len(self._terms) and self._terms[i].startswith(token):
+            yield self._terms[i]
+            i += 1
+
+    def search(self, query: str) -> Dict[object, float]:
+        """Scores the rows matching every word of the query, or a word starting with it."""
+        scores = None
+        for token in tokenize(query):
+            token_scores = collections.defaultdict(float)
+            for term in self._expand(token):
+                idf = math.log(1 + self._size / len(self.postings[term]))
+                # Whole words count more than prefixes
+                weight = idf if term == token else idf / 2
+                for key in self.postings[term]:
+                    token_scores[key] = max(token_scores[key], weight)
+
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+
+        return dict(scores or {})
+
+
+class EventIndex:
+    def __init__(self, db_events):
+        self.who = InvertedIndex()
+        self.what = InvertedIndex()
+        for db_event in db_events:
+            self.who.add(db_event.when, db_event.who)
+            self.what.add(db_event.when, db_event.what)
+        self.who.freeze()
+        self.what.freeze()
+        self.created = time.monotonic()
+
+    def search(self, who: Optional[str], what: Optional[str]) -> List:
+        """Returns the dates of the matching events, best match and most recent first."""
+        results = [index.search(query) for index, query in ((self.who, who), (self.what, what)) if query]
+        if not results:
+            return []
+
+        scores = results[0]
+        for other in results[1:]:
+            scores = {key: score + other[key] for key, score in scores.items() if key in other}
+
+        return sorted(scores, key=lambda key: (scores[key], key), reverse=True)
+
+
+_index: Optional[EventIndex] = None
+
+
+def _invalidate(*args):
+    global _index
+    _index = None
+
+
+for _name in ("after_insert", "after_update", "after_delete"):
+    event.listen(models.Event, _name, _invalidate)
+
+
+def get_index(db: Session) -> EventIndex:
+    global _index
+
+    if _index is None or time.monotonic() - _index.created > INDEX_MAX_AGE:
+        _index = EventIndex(db.query(models.Event.when, models.Event.who, models.Event.what))
+
+    return _index
+
+
+def is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def create_indexes(engine):
+    """Creates the trigram indexes used for searching on PostgreSQL. Does nothing on other databases."""
+    if engine.dialect.name != "postgresql":
+        return
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in ("who", "what"):
+            conn.execute(
+                text(f"CREATE INDEX IF NOT EXISTS ix_events_{column}_trgm ON events USING gin ({column} gin_trgm_ops)")
+            )
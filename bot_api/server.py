@@ -0,0 +1,123 @@
+"""Gunicorn configuration for running the bot-api in production.
+
+Usage:
+    gunicorn -c python:bot_api.server bot_api.main:app
+
+Every setting can be overridden through environment variables, see the README.
+"""
+import multiprocessing
+import os
+
+from uvicorn.workers import UvicornWorker as _UvicornWorker
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if not value:
+        return default
+
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def get_memory_limit_mb():
+    """Returns the memory available to this container in MB, or None if it cannot be determined."""
+    # cgroup v2, then cgroup v1
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+
+        # An unlimited cgroup is reported either as "max" or as a huge number
+        if value.isdigit() and int(value) < 2 ** 60:
+            return int(value) // (1024 * 1024)
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def get_worker_count(
+    cpu_count: int, memory_mb=None, worker_memory_mb: int = 128, max_workers: int = 8, preload: bool = True
+):
+    """Sizes the worker pool from the number of cores, bounded by how many workers fit in memory.
+
+    Without preloading every worker starts its own scheduler, so then there is a single worker.
+    """
+    if not preload:
+        return 1
+
+    workers = 2 * cpu_count + 1
+
+    if memory_mb is not None:
+        workers = min(workers, memory_mb // worker_memory_mb)
+
+    return max(1, min(workers, max_workers))
+
+
+class UvicornWorker(_UvicornWorker):
+    """Uvicorn worker using uvloop and httptools when they are installed."""
+
+    CONFIG_KWARGS = {
+        "loop": os.environ.get("UVICORN_LOOP", "auto"),
+        "http": os.environ.get("UVICORN_HTTP", "auto"),
+    }
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "bot_api.server.UvicornWorker"
+preload_app = _env_bool("GUNICORN_PRELOAD", True)
+workers = _env_int(
+    "WEB_CONCURRENCY",
+    get_worker_count(
+        multiprocessing.cpu_count(),
+        memory_mb=get_memory_limit_mb(),
+        worker_memory_mb=_env_int("WORKER_MEMORY_MB", 128),
+        max_workers=_env_int("MAX_WORKERS", 8),
+        preload=preload_app,
+    ),
+)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 20)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    """Creates the tables and starts the scheduler once, in the master, before any worker is forked."""
+    if not preload_app:
+        return
+
+    from bot_api import main
+
+    main.init_app()
+    # Workers inherit the environment, so they know not to start another scheduler
+    os.environ["BOT_API_INITIALIZED"] = "1"
+    main.engine.dispose()
+
+
+def post_fork(server, worker):
+    """Drops database connections and pool statistics inherited from the master without closing the connections."""
+    if not preload_app:
+        return
+
+    from bot_api.database import engine, pool_stats
+
+    engine.dispose(close=False)
+    pool_stats.reset()
@@ -0,0 +1,173 @@
+"""Aggregate statistics of the schedule.
+
+The counters in the `presenter_stats`, `cancellation_stats` and `schedule_stats` tables are
+updated by the crud write functions in the same transaction as the event itself, so reading
+them does not depend on the size of the `events` table. Events written around crud (e.g. by
+scripts/yaml_to_db.py) are only counted after a rebuild:
+
+    python scripts/rebuild_stats.py
+"""
+import datetime
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from bot_api import models
+
+
+EventSnapshot = namedtuple("EventSnapshot", ["when", "event_type", "who", "what"])
+
+# Dialects supporting INSERT ... ON CONFLICT DO NOTHING
+_inserts = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def snapshot(db_event: Optional[models.Event]) -> Optional[EventSnapshot]:
+    if db_event is None:
+        return None
+
+    return EventSnapshot(db_event.when, db_event.event_type, db_event.who, db_event.what)
+
+
+def is_talk(event: EventSnapshot) -> bool:
+    return bool(event.who) and bool(event.what)
+
+
+def is_cancelled(event: EventSnapshot) -> bool:
+    return bool(event.what) and not event.who
+
+
+def _get_or_create(db: Session, model, **key):
+    """Returns the counter row with this key, locked until the end of the transaction."""
+    insert = _inserts.get(db.get_bind().dialect.name)
+    if insert is not None:
+        # SELECT ... FOR UPDATE does not lock a row that does not exist yet, so two transactions
+        # counting the first talk of a presenter would both insert it. Inserting first makes the
+        # second one wait for the first on the primary key instead.
+        db.execute(insert(model).values(**key).on_conflict_do_nothing())
+        return db.query(model).filter_by(**key).with_for_update().one()
+
+    row = db.query(model).filter_by(**key).with_for_update().first()
+    if row is None:
+        row = model(**key)
+        db.add(row)
+        # So that it is found by the next query in this transaction
+        db.flush()
+
+    return row
+
+
+def _add(db: Session, event: EventSnapshot, sign: int):
+    schedule = _get_or_create(db, models.ScheduleStats, event_type=event.event_type or "")
+    schedule.dates = (schedule.dates or 0) + sign
+
+    if is_talk(event):
+        schedule.talks = (schedule.talks or 0) + sign
+
+        presenter = _get_or_create(db, models.PresenterStats, who=event.who)
+        presenter.talks = (presenter.talks or 0) + sign
+        if sign > 0 and (presenter.last_talk is None or event.when > presenter.last_talk):
+            presenter.last_talk = event.when
+        elif sign < 0 and event.when == presenter.last_talk:
+            # Flushed first, so the event itself is already changed or gone
+            db.flush()
+            presenter.last_talk = (
+                db.query(func.max(models.Event.when))
+                .filter(models.Event.who == event.who, models.Event.what.isnot(None))
+                .scalar()
+            )
+
+        if presenter.talks <= 0:
+            db.delete(presenter)
+            db.flush()
+
+    elif is_cancelled(event):
+        schedule.cancelled = (schedule.cancelled or 0) + sign
+
+        cancellation = _get_or_create(db, models.CancellationStats, reason=event.what)
+        cancellation.count = (cancellation.count or 0) + sign
+        if cancellation.count <= 0:
+            db.delete(cancellation)
+            db.flush()
+
+
+def record_change(db: Session, before: Optional[EventSnapshot], after: Optional[EventSnapshot]):
+    """Updates the counters for an event going from `before` to `after`, either of which may be None.
+
+    Does not commit, call it before the commit that writes the event.
+    """
+    if before == after:
+        return
+
+    if before is not None:
+        _add(db, before, -1)
+    if after is not None:
+        _add(db, after, 1)
+
+
+def rebuild(db: Session):
+    """Recomputes all counters from the events table."""
+    for model in (models.PresenterStats, models.CancellationStats, models.ScheduleStats):
+        db.query(model).delete()
+
+    schedule, presenters, cancellations = {}, {}, {}
+    for event in db.query(models.Event.when, models.Event.event_type, models.Event.who, models.Event.what):
+        event = EventSnapshot(*event)
+        row = schedule.setdefault(event.event_type or "", [0, 0, 0])
+        row[0] += 1
+
+        if is_talk(event):
+            row[1] += 1
+            talks, last_talk = presenters.get(event.who, (0, event.when))
+            presenters[event.who] = (talks + 1, max(last_talk, event.when))
+        elif is_cancelled(event):
+            row[2] += 1
+            cancellations[event.what] = cancellations.get(event.what, 0) + 1
+
+    db.add_all(
+        models.ScheduleStats(event_type=event_type, dates=dates, talks=talks, cancelled=cancelled)
+        for event_type, (dates, talks, cancelled) in schedule.items()
+    )
+    db.add_all(
+        models.PresenterStats(who=who, talks=talks, last_talk=last_talk)
+        for who, (talks, last_talk) in presenters.items()
+    )
+    db.add_all(models.CancellationStats(reason=reason, count=count) for reason, count in cancellations.items())
+    db.commit()
+
+
+def rebuild_if_empty(db: Session):
+    """Builds the counters the first time, when there are events but no statistics yet."""
+    if db.query(models.ScheduleStats).first() is None and db.query(models.Event).first() is not None:
+        rebuild(db)
+
+
+def get_schedule_stats(db: Session):
+    return db.query(models.ScheduleStats).order_by(models.ScheduleStats.event_type).all()
+
+
+def get_presenter_stats(db: Session):
+    """Returns the presenters, the one who presented longest ago first."""
+    return db.query(models.PresenterStats).order_by(models.PresenterStats.last_talk, models.PresenterStats.who).all()
+
+
+def get_last_talks(db: Session, whos: List[str], until: datetime.date) -> Dict[str, datetime.date]:
+    """Returns the date of the latest talk on or before `until` of each of these presenters who had one.
+
+    The counters only hold the latest talk, which may be a scheduled one.
+    """
+    if not whos:
+        return {}
+
+    rows = (
+        db.query(models.Event.who, func.max(models.Event.when))
+        .filter(models.Event.who.in_(whos), models.Event.what.isnot(None), models.Event.when <= until)
+        .group_by(models.Event.who)
+    )
+    return dict(rows.all())
+
+
+def get_cancellation_stats(db: Session):
+    return db.query(models.CancellationStats).order_by(models.CancellationStats.count.desc()).all()
@@ -0,0 +1,88 @@
+"""Compares request throughput of the old Procfile server profile with the tuned one in bot_api.server.
+
+Usage:
+    python scripts/bench_server.py [--requests 2000] [--concurrency 32] [--path /api/v1.0/ping]
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+PROFILES = {
+    "current": ["-w", "1", "-k", "uvicorn.workers.UvicornWorker"],
+    "tuned": ["-c", "python:bot_api.server"],
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+
+    raise RuntimeError(f"Server did not start within {timeout} seconds")
+
+
+def run_load(url, method, n_requests, concurrency):
+    local = threading.local()
+
+    def one(_):
+        # One keep-alive session per thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        session = local.session
+        start = time.perf_counter()
+        session.request(method, url)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(one, range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    return n_requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def bench_profile(name, args, port, opts, env):
+    cmd = [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", *args, "bot_api.main:app"]
+    proc = subprocess.Popen(cmd, env={**env, "PORT": str(port)}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/api/v1.0/ping")
+        url = f"http://127.0.0.1:{port}{opts.path}"
+        run_load(url, opts.method, min(200, opts.requests), opts.concurrency)  # warm up
+        rps, p50, p99 = run_load(url, opts.method, opts.requests, opts.concurrency)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    print(f"{name:>8}: {rps:8.1f} req/s   p50 {p50 * 1000:6.1f} ms   p99 {p99 * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--path", default="/api/v1.0/ping")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--port", type=int, default=8765)
+    opts = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{tmp_dir}/bench.db")
+    env.setdefault("BOT_LOG_FILE", os.path.join(tmp_dir, "bot_log.log"))
+
+    for name, args in PROFILES.items():
+        bench_profile(name, args, opts.port, opts, env)
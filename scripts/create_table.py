@@ -6,6 +6,7 @@ from sqlalchemy import create_engine, Table, Column, Integer, String, Date
 from sqlalchemy.ext.declarative import declarative_base
 
 from bot_api.models import Event
+from bot_api.search import create_indexes
 
 database_url = os.environ.get("DATABASE_URL")
 engine = create_engine(database_url, echo=True)
@@ -18,3 +19,4 @@ if __name__ == "__main__":
         print(e)
 
     Event.metadata.create_all(engine)
+    create_indexes(engine)
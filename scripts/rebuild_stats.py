@@ -0,0 +1,20 @@
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from bot_api import stats
+from bot_api.models import Base
+
+
+database_url = os.environ.get("DATABASE_URL")
+
+if __name__ == "__main__":
+    engine = create_engine(database_url)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    stats.rebuild(session)
+
+    for row in stats.get_schedule_stats(session):
+        print(row.event_type, row.dates, row.talks, row.cancelled)
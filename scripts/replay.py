@@ -0,0 +1,188 @@
+"""Replays Slack traffic recorded with BOT_CAPTURE_FILE against a running instance of the bot.
+
+Usage:
+    python scripts/replay.py capture.jsonl --url http://127.0.0.1:8000 --secret test-secret
+        [--compare-url http://127.0.0.1:8001] [--speed 0] [--concurrency 8]
+
+Every request is signed again with `--secret`, so start the instances with
+SLACK_SIGNING_SECRET set to the same value. Give each instance its own copy of a database
+snapshot, since replayed commands may write to it, disable the rate limits and leave the Slack
+tokens unset so that nothing is posted to Slack:
+
+    cp snapshot.db /tmp/a.db
+    DATABASE_URL=sqlite:////tmp/a.db SLACK_SIGNING_SECRET=test-secret \\
+        BOT_USER_RATE_LIMIT=0 BOT_CHANNEL_RATE_LIMIT=0 uvicorn bot_api.main:app --port 8000
+
+`--speed 1` keeps the original pace, `--speed 10` replays ten times faster and `--speed 0` sends
+the requests as fast as `--concurrency` allows. With `--compare-url` every request is sent to both
+instances, and the latencies of the two are reported side by side with the responses that differ.
+"""
+import argparse
+import collections
+import hashlib
+import hmac
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import requests
+
+
+def read_capture(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sign(secret: str, body: str, timestamp: int) -> str:
+    basestring = f"v0:{timestamp}:{body}".encode("utf-8")
+    return "v0=" + hmac.new(secret.encode("utf-8"), basestring, hashlib.sha256).hexdigest()
+
+
+def label(entry) -> str:
+    """The command name or event type of a request, to group latencies by."""
+    if entry["path"].endswith("/command"):
+        text = dict(parse_qsl(entry["body"])).get("text", "").split()
+        return f"command {text[0] if text else 'help'}"
+
+    try:
+        payload = json.loads(entry["body"])
+    except ValueError:
+        return "events ?"
+    return f"events {payload.get('event', {}).get('type') or payload.get('type', '?')}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Target:
+    def __init__(self, url, secret):
+        self.url = url.rstrip("/")
+        self.secret = secret
+        self.latencies = collections.defaultdict(list)
+        self.statuses = collections.Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def send(self, entry):
+        # One keep-alive session per thread
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+
+        timestamp = int(time.time())
+        headers = {
+            **entry["headers"],
+            "X-Slack-Request-Timestamp": str(timestamp),
+            "X-Slack-Signature": sign(self.secret, entry["body"], timestamp),
+        }
+        start = time.perf_counter()
+        try:
+            response = self._local.session.post(self.url + entry["path"], data=entry["body"].encode(), headers=headers)
+        except requests.RequestException as e:
+            status, text = "error", f"{type(e).__name__}: {e}"
+        else:
+            status, text = response.status_code, response.text
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.latencies[label(entry)].append(elapsed)
+            self.statuses[status] += 1
+
+        return status, text
+
+
+def replay(entries, targets, speed, concurrency):
+    """Sends the entries to all targets.
+
+    Returns the (entry, responses) of those answered differently, and the (entry, exception) of
+    those that could not be replayed.
+    """
+    diffs = []
+    first = entries[0]["time"] if entries else 0
+    start = time.time()
+
+    def one(entry):
+        responses = [target.send(entry) for target in targets]
+        if any(response != responses[0] for response in responses[1:]):
+            diffs.append((entry, responses))
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            if speed > 0:
+                delay = (entry["time"] - first) / speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            futures.append((entry, pool.submit(one, entry)))
+
+    failures = [(entry, future.exception()) for entry, future in futures if future.exception() is not None]
+    return diffs, failures
+
+
+def report(targets, recorded):
+    names = sorted({name for target in targets for name in target.latencies})
+    columns = ["recorded"] + [target.url for target in targets]
+    print("Latency p50/p90/p99/max per command or event type")
+    print(f"{'':<24}" + "".join(f"{column:>40}" for column in columns))
+
+    for name in ["all"] + names:
+        cells = []
+        for latencies in [recorded] + [target.latencies for target in targets]:
+            values = [v for values in latencies.values() for v in values] if name == "all" else latencies.get(name)
+            if values:
+                cells.append(
+                    "/".join(f"{1000 * percentile(values, q):.0f}" for q in (0.5, 0.9, 0.99))
+                    + f"/{1000 * max(values):.0f} ms (n={len(values)})"
+                )
+            else:
+                cells.append("-")
+        print(f"{name:<24}" + "".join(f"{cell:>40}" for cell in cells))
+
+    print()
+    for target in targets:
+        print(f"{target.url}: status {dict(target.statuses)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--compare-url")
+    parser.add_argument("--secret", required=True)
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-diffs", type=int, default=20, help="Number of differing responses to print")
+    opts = parser.parse_args()
+
+    entries = sorted(read_capture(opts.capture), key=lambda entry: entry["time"])
+    targets = [Target(url, opts.secret) for url in (opts.url, opts.compare_url) if url]
+
+    recorded = collections.defaultdict(list)
+    for entry in entries:
+        if entry.get("ms") is not None:
+            recorded[label(entry)].append(entry["ms"] / 1000)
+
+    diffs, failures = replay(entries, targets, opts.speed, opts.concurrency)
+    report(targets, recorded)
+
+    if failures:
+        print(f"\n{len(failures)} of {len(entries)} requests could not be replayed")
+        for entry, e in failures[: opts.max_diffs]:
+            print(f"  {entry.get('path')} {str(entry.get('body'))[:200]}: {type(e).__name__}: {e}")
+
+    if opts.compare_url:
+        print(f"\n{len(diffs)} of {len(entries)} responses differ")
+        for entry, responses in diffs[: opts.max_diffs]:
+            print(f"\n{label(entry)}: {entry['body'][:200]}")
+            for target, (status, text) in zip(targets, responses):
+                print(f"  {target.url} [{status}]: {text[:500]}")
+
+    return 1 if diffs or failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import json
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from bot_api import capture, logs
+
+
+def test_anonymize_form_body():
+    body = urlencode(
+        {
+            "token": "secret",
+            "user_id": "U012AB3CD",
+            "user_name": "ola.nordmann",
+            "channel_id": "C0YMPPHT6",
+            "response_url": "https://hooks.slack.com/commands/1",
+            "command": "/c",
+            "text": "update --date 13.03 --who Ola Nordmann --what Testing",
+        }
+    ).encode()
+
+    fields = dict(parse_qsl(capture.anonymize_body(body, "application/x-www-form-urlencoded")))
+
+    assert set(fields) == {"user_id", "channel_id", "command", "text"}
+    assert fields["user_id"] != "U012AB3CD" and fields["user_id"].startswith("U")
+    assert fields["text"].startswith("update --date 13.03 --who person-")
+    assert fields["text"].endswith(" --what Testing")
+    assert "Nordmann" not in fields["text"]
+
+
+def test_anonymize_text_with_equals_sign():
+    text = capture.anonymize_text("schedule --who=Ola Nordmann --what X")
+
+    assert text.startswith("schedule --who=person-")
+    assert text.endswith(" --what X")
+    assert "Ola" not in text
+
+
+def test_anonymize_json_body():
+    body = json.dumps(
+        {
+            "token": "secret",
+            "type": "event_callback",
+            "event_id": "Ev1",
+            "authorizations": [{"user_id": "U0BOT"}],
+            "event": {"type": "app_mention", "user": "U012AB3CD", "text": "<@U0BOT> next", "channel": "C0YMPPHT6"},
+        }
+    ).encode()
+
+    payload = json.loads(capture.anonymize_body(body, "application/json"))
+
+    assert set(payload) == {"type", "event_id", "event"}
+    assert payload["event"]["user"] == capture.pseudonymize("U012AB3CD")
+    assert payload["event"]["text"] == f"<@{capture.pseudonymize('U0BOT')}> next"
+
+
+def test_pseudonyms_are_stable_and_salted(monkeypatch):
+    first = capture.pseudonymize("U012AB3CD")
+    assert capture.pseudonymize("U012AB3CD") == first
+    assert capture.pseudonymize("U999") != first
+
+    monkeypatch.setattr(capture, "CAPTURE_SALT", "other")
+    assert capture.pseudonymize("U012AB3CD") != first
+
+
+def test_middleware_records_captured_paths(tmp_path):
+    app = FastAPI()
+
+    @app.post("/api/v1.0/command")
+    def command():
+        return {"text": "ok"}
+
+    @app.get("/api/v1.0/ping")
+    def ping():
+        return "pong"
+
+    filename = tmp_path / "capture.jsonl"
+    app.add_middleware(capture.CaptureMiddleware, filename=str(filename))
+    client = TestClient(app)
+    client.post(
+        "/api/v1.0/command",
+        data={"token": "secret", "text": "next"},
+        headers={"X-Slack-Retry-Num": "1"},
+    )
+    client.get("/api/v1.0/ping")
+    logs.stop_logging(capture.__name__)
+
+    entries = [json.loads(line) for line in filename.read_text().splitlines()]
+    assert len(entries) == 1
+    assert entries[0]["path"] == "/api/v1.0/command"
+    assert entries[0]["status"] == 200
+    assert entries[0]["ms"] >= 0
+    assert entries[0]["headers"] == {"content-type": "application/x-www-form-urlencoded", "x-slack-retry-num": "1"}
+    assert entries[0]["body"] == "text=next"
@@ -6,7 +6,7 @@ from mock import Mock
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from bot_api import commands, models, crud
+from bot_api import commands, crud, errors, models
 
 
 def test_prettify_date():
@@ -133,3 +133,79 @@ def test__nearest():
 
     res = crud._nearest(items, datetime.datetime(2019, 11, 11).date())
     assert res.when == datetime.datetime(2020, 2, 27).date()
+
+
+def test_get_error_response():
+    assert commands.get_error_response(errors.PastDateError(), commands.registry["add"]) == (
+        commands.default_responses["PAST_DATE_ERROR"]
+    )
+    assert commands.get_error_response(errors.UsageError(), commands.registry["remove"]) == (
+        "Usage error: `/c remove --when yyyy-mm-dd`"
+    )
+
+
+def test_get_error_response_reraises_unknown_errors():
+    with pytest.raises(KeyError):
+        commands.get_error_response(KeyError("who"), commands.registry["next"])
+
+
+def test_get_invalid_command_response():
+    assert "`schedule`" in commands.get_invalid_command_response("shedule")
+    assert commands.get_invalid_command_response("xyzzy") == commands.default_responses["INVALID_COMMAND"]
+
+
+def test_split_message():
+    assert commands.split_message("short") == ["short"]
+    assert commands.split_message("aaa\nbbb\nccc", max_length=7) == ["aaa\nbbb", "ccc"]
+    assert commands.split_message("aaaaaaaaaa", max_length=4) == ["aaaa", "aaaa", "aa"]
+    assert all(len(chunk) <= 50 for chunk in commands.split_message("\n".join(["x" * 20] * 30), max_length=50))
+
+
+def test_split_message_notes_truncation():
+    chunks = commands.split_message("\n".join(["x" * 20] * 30), max_length=100, max_chunks=2)
+
+    assert len(chunks) == 2
+    assert all(len(chunk) <= 100 for chunk in chunks)
+    assert chunks[-1].endswith(commands.default_responses["TRUNCATED"])
+
+
+def test_list_upcoming_events_empty(mock_db, monkeypatch):
+    monkeypatch.setattr(crud, "get_upcoming_events", lambda *args, **kwargs: [])
+    args = commands.get_args_from_request("upcoming")
+
+    assert commands.list_upcoming_events(args, mock_db) == commands.default_responses["NO_EVENTS"]
+
+
+def test_list_upcoming_events_pages(mock_db, mock_event_fagdag, monkeypatch):
+    calls = []
+
+    def get_upcoming_events(db, when, until=None, offset=0, limit=None):
+        calls.append((until, offset, limit))
+        return [mock_event_fagdag] * 3
+
+    monkeypatch.setattr(crud, "get_upcoming_events", get_upcoming_events)
+    args = commands.get_args_from_request("upcoming --limit 2 --until 1 jun 2020 --page 2")
+
+    response = commands.list_upcoming_events(args, mock_db)
+
+    assert calls == [(datetime.date(2020, 6, 1), 2, 3)]
+    assert response.count("Thu 7 May") == 2
+    assert response.endswith("`/c upcoming --limit 2 --until 1 jun 2020 --page 3`")
+
+
+@pytest.mark.parametrize("options", ["--limit 0", "--limit -1", "--page 0"])
+def test_list_upcoming_events_rejects_invalid_options(mock_db, options):
+    args = commands.get_args_from_request(f"upcoming {options}")
+
+    with pytest.raises(errors.UsageError):
+        commands.list_upcoming_events(args, mock_db)
+
+
+def test_list_upcoming_events_caps_limit(mock_db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(crud, "get_upcoming_events", lambda *args, **kwargs: calls.append(kwargs) or [])
+    args = commands.get_args_from_request("upcoming --limit 100000")
+
+    commands.list_upcoming_events(args, mock_db)
+
+    assert calls[0]["limit"] == commands.upcoming_max_limit + 1
@@ -0,0 +1,65 @@
+import datetime
+
+import pytest
+
+from bot_api import models
+from bot_api.database import PoolStats, engine, pool_stats, session_scope
+
+
+@pytest.fixture(autouse=True)
+def tables():
+    models.Base.metadata.create_all(bind=engine)
+    yield
+    models.Base.metadata.drop_all(bind=engine)
+
+
+def test_session_scope_commits():
+    with session_scope() as db:
+        db.add(models.Event(when=datetime.date(2020, 5, 7), event_type="fagdag"))
+
+    with session_scope(read_only=True) as db:
+        assert db.query(models.Event).count() == 1
+
+
+def test_session_scope_rolls_back_on_error():
+    with pytest.raises(ValueError):
+        with session_scope() as db:
+            db.add(models.Event(when=datetime.date(2020, 5, 7), event_type="fagdag"))
+            db.flush()
+            raise ValueError
+
+    with session_scope(read_only=True) as db:
+        assert db.query(models.Event).count() == 0
+
+
+def test_session_scope_records_checkouts():
+    checkouts = pool_stats.checkouts
+
+    with session_scope(read_only=True):
+        pass
+
+    assert pool_stats.checkouts == checkouts + 1
+
+
+def test_pool_stats_as_dict():
+    stats = PoolStats()
+    stats.record_checkout(0.002)
+    stats.record_checkout(0.004)
+
+    data = stats.as_dict()
+
+    assert data["checkouts"] == 2
+    assert data["mean_checkout_ms"] == pytest.approx(3)
+    assert data["max_checkout_ms"] == pytest.approx(4)
+
+
+def test_pool_stats_reset():
+    stats = PoolStats()
+    stats.record_connect()
+    stats.record_checkout(0.002)
+
+    stats.reset()
+    data = stats.as_dict()
+
+    assert (data["checkouts"], data["connects"]) == (0, 0)
+    assert data["mean_checkout_ms"] == data["max_checkout_ms"] == 0
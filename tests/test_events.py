@@ -0,0 +1,116 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot_api import main
+from bot_api.errors import EventQueueFullError
+from bot_api.events import EventDispatcher, TTLCache
+
+
+def payload(event_id, event_type="app_mention"):
+    return {"type": "event_callback", "event_id": event_id, "event": {"type": event_type, "text": "hi"}}
+
+
+def test_ttl_cache_expires():
+    now = [0]
+    cache = TTLCache(ttl=10, clock=lambda: now[0])
+
+    assert cache.add("a")
+    assert not cache.add("a")
+
+    now[0] = 11
+    assert "a" not in cache
+    assert cache.add("a")
+
+
+def test_ttl_cache_is_bounded():
+    cache = TTLCache(maxsize=2)
+    for key in "abc":
+        cache.add(key)
+
+    assert len(cache) == 2
+    assert "a" not in cache
+    assert "c" in cache
+
+
+def test_dispatch_runs_sync_and_async_handlers():
+    dispatcher = EventDispatcher(workers=2)
+    handled = []
+
+    @dispatcher.register("app_mention")
+    def sync_handler(event):
+        handled.append(("sync", event["text"]))
+
+    @dispatcher.register("app_mention")
+    async def async_handler(event):
+        handled.append(("async", event["text"]))
+
+    async def run():
+        assert dispatcher.dispatch(payload("Ev1"))
+        await dispatcher.shutdown()
+
+    asyncio.run(run())
+
+    assert sorted(handled) == [("async", "hi"), ("sync", "hi")]
+
+
+def test_dispatch_ignores_retries_and_unknown_events():
+    dispatcher = EventDispatcher()
+    handled = []
+    dispatcher.register("app_mention")(handled.append)
+
+    async def run():
+        assert dispatcher.dispatch(payload("Ev1"))
+        assert not dispatcher.dispatch(payload("Ev1"), retry_num="1")
+        assert not dispatcher.dispatch(payload("Ev2", event_type="reaction_added"))
+        await dispatcher.shutdown()
+
+    asyncio.run(run())
+
+    assert len(handled) == 1
+
+
+def test_dispatch_raises_when_queue_is_full():
+    dispatcher = EventDispatcher(workers=1, queue_size=1)
+    dispatcher.register("app_mention")(lambda event: None)
+
+    async def run():
+        assert dispatcher.dispatch(payload("Ev1"))
+        with pytest.raises(EventQueueFullError):
+            dispatcher.dispatch(payload("Ev2"))
+        await dispatcher.shutdown()
+
+    asyncio.run(run())
+
+    # A dropped event is not remembered, so Slack's retry gets through
+    assert "Ev2" not in dispatcher.seen
+
+
+def test_dispatch_queues_all_handlers_or_none():
+    dispatcher = EventDispatcher(workers=1, queue_size=3)
+    handled = []
+    dispatcher.register("app_mention")(lambda event: handled.append("first"))
+    dispatcher.register("app_mention")(lambda event: handled.append("second"))
+
+    async def run():
+        dispatcher._start()
+        # Workers do not run before the next await, so the queue holds both handlers of Ev1
+        assert dispatcher.dispatch(payload("Ev1"))
+        with pytest.raises(EventQueueFullError):
+            dispatcher.dispatch(payload("Ev2"))
+        await dispatcher.shutdown()
+
+    asyncio.run(run())
+
+    assert sorted(handled) == ["first", "second"]
+
+
+def test_events_endpoint_asks_for_retry_when_queue_is_full(monkeypatch):
+    monkeypatch.setattr(main, "validate_request", lambda *args: True)
+    monkeypatch.setattr(main.dispatcher, "dispatch", mock.Mock(side_effect=EventQueueFullError("Ev1")))
+
+    response = TestClient(main.app).post("/api/v1.0/events", json=payload("Ev1"))
+
+    assert response.status_code == 503
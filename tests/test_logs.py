@@ -0,0 +1,53 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from bot_api import logs
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    filename = tmp_path / "bot_log.log"
+    logs.setup_logging(filename=str(filename))
+    yield filename
+    logs.stop_logging()
+
+
+def test_setup_logging_writes_json_lines(log_file):
+    logging.getLogger("test").info("Received %s", "event", extra={"payload": {"type": "app_mention"}})
+    logs.stop_logging()
+
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert records[-1]["message"] == "Received event"
+    assert records[-1]["payload"] == {"type": "app_mention"}
+
+
+def test_setup_logging_appends(log_file):
+    logging.getLogger("test").info("first")
+    logs.setup_logging(filename=str(log_file))
+    logging.getLogger("test").info("second")
+    logs.stop_logging()
+
+    assert len(log_file.read_text().splitlines()) == 2
+
+
+def test_text_formatter_includes_extra():
+    record = logging.makeLogRecord({"msg": "Received event", "payload": {"a": 1}})
+
+    assert logs.TextFormatter().format(record).endswith('Received event {"payload":{"a":1}}')
+
+
+def test_queue_handler_drops_when_full():
+    handler = logs.DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.handle(logging.makeLogRecord({"msg": "first"}))
+    handler.handle(logging.makeLogRecord({"msg": "second"}))
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_sample():
+    assert logs.sample(1)
+    assert not logs.sample(0)
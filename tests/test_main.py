@@ -0,0 +1,108 @@
+import contextlib
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bot_api import commands, crud, errors, main
+from bot_api.ratelimit import ConcurrencyLimiter, TokenBucketLimiter
+from bot_api.registry import CommandRegistry
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """A copy of the command registry that tests can add commands to."""
+    registry = CommandRegistry()
+    for c in commands.registry:
+        registry.add(c.name, c.command, c.help_text, c.usage, c.uses_db, c.read_only)
+    monkeypatch.setattr(commands, "registry", registry)
+    return registry
+
+
+def fail(error):
+    def command(args, db):
+        raise error
+
+    return command
+
+
+def test_handle_command_responds_in_channel(registry):
+    registry.add("hello", lambda args, db: "Hello!", help_text="", usage="", uses_db=False)
+
+    assert main.handle_command("hello") == {"text": "Hello!", "response_type": "in_channel"}
+    assert main.handle_command("hello --silent") == {"text": "Hello!", "response_type": "ephemeral"}
+
+
+def test_handle_command_does_not_hide_key_errors(registry):
+    registry.add("lookup", fail(KeyError("who")), help_text="", usage="", uses_db=False)
+
+    with pytest.raises(KeyError):
+        main.handle_command("lookup")
+
+
+def test_command_endpoint_reports_key_errors_as_server_errors(registry, monkeypatch):
+    registry.add("lookup", fail(KeyError("who")), help_text="", usage="", uses_db=False)
+    monkeypatch.setattr(main, "validate_request", lambda *args: True)
+
+    client = TestClient(main.app, raise_server_exceptions=False)
+    response = client.post("/api/v1.0/command", data={"text": "lookup", "user_id": "U1", "channel_id": "C1"})
+
+    assert response.status_code == 500
+
+
+def test_handle_command_responds_to_command_errors(registry, monkeypatch):
+    registry.add("past", fail(errors.PastDateError()), help_text="", usage="")
+    monkeypatch.setattr(main, "db_limiter", ConcurrencyLimiter(limit=1, timeout=0))
+
+    for _ in range(2):
+        # The second call only gets the database slot if the first one released it
+        assert main.handle_command("past") == {
+            "text": commands.default_responses["PAST_DATE_ERROR"],
+            "response_type": "ephemeral",
+        }
+
+
+def test_handle_command_suggests_similar_command(registry):
+    response = main.handle_command("shedule --when friday")
+
+    assert response["response_type"] == "ephemeral"
+    assert response["text"] == commands.get_invalid_command_response("shedule")
+    assert "`schedule`" in response["text"]
+
+
+@pytest.fixture
+def search_client(db, monkeypatch):
+    @contextlib.contextmanager
+    def session_scope(read_only=False):
+        yield db
+
+    monkeypatch.setattr(main, "session_scope", session_scope)
+    monkeypatch.setattr(main, "channel_limiter", TokenBucketLimiter(rate=1, capacity=100))
+    return TestClient(main.app)
+
+
+def test_search_endpoint_pages(db, search_client):
+    for day in range(1, 4):
+        db_event = crud.create_event(db, when=datetime.date(2019, 4, day), event_type="formiddag")
+        crud.update_event(db, db_event, who="Ola Skavhaug", what=f"Talk {day}")
+
+    first = search_client.get("/api/v1.0/search", params={"who": "ola", "page_size": 2}).json()
+    second = search_client.get("/api/v1.0/search", params={"who": "ola", "page_size": 2, "page": 2}).json()
+
+    assert (len(first["events"]), first["page"], first["has_more"]) == (2, 1, True)
+    assert (len(second["events"]), second["page"], second["has_more"]) == (1, 2, False)
+
+
+def test_search_endpoint_is_busy_without_database_slot(search_client, monkeypatch):
+    limiter = ConcurrencyLimiter(limit=1, timeout=0)
+    limiter.acquire()
+    monkeypatch.setattr(main, "db_limiter", limiter)
+
+    assert search_client.get("/api/v1.0/search", params={"who": "ola"}).status_code == 503
+
+
+def test_search_endpoint_is_rate_limited(search_client, monkeypatch):
+    monkeypatch.setattr(main, "channel_limiter", TokenBucketLimiter(rate=1, capacity=1, clock=lambda: 0))
+
+    assert search_client.get("/api/v1.0/search", params={"who": "ola"}).status_code == 200
+    assert search_client.get("/api/v1.0/search", params={"who": "ola"}).status_code == 429
@@ -0,0 +1,51 @@
+import cProfile
+import os
+import time
+
+from bot_api import profiling
+
+
+def test_has_valid_signature():
+    value = profiling.sign(int(time.time()), "secret")
+
+    assert profiling.has_valid_signature(value, "secret")
+    assert not profiling.has_valid_signature(value, "other secret")
+    assert not profiling.has_valid_signature(value, None)
+    assert not profiling.has_valid_signature("garbage", "secret")
+
+
+def test_has_valid_signature_expired():
+    value = profiling.sign(int(time.time()) - 60 * 10, "secret")
+
+    assert not profiling.has_valid_signature(value, "secret")
+
+
+def test_maybe_profile_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, "ENABLED", False)
+
+    assert profiling.maybe_profile({}, "next") is profiling._disabled
+
+
+def test_maybe_profile_signed_header(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    headers = {profiling.PROFILE_HEADER: profiling.sign(int(time.time()), "secret")}
+
+    with profiling.maybe_profile(headers, "next"):
+        sorted(range(1000))
+
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_write_profile_keeps_bounded_ring(tmp_path):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    sum(range(100))
+    profiler.disable()
+
+    for _ in range(5):
+        profiling.write_profile(profiler, "next", directory=str(tmp_path), keep=3)
+
+    assert len(os.listdir(tmp_path)) == 3
+    assert "sum" in profiling.summarize(profiler)
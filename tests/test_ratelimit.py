@@ -0,0 +1,56 @@
+from bot_api import main
+from bot_api.ratelimit import ConcurrencyLimiter, TokenBucketLimiter, make_limiter
+
+
+def test_token_bucket_allows_burst_then_refills():
+    now = [0]
+    limiter = TokenBucketLimiter(rate=1, capacity=3, clock=lambda: now[0])
+
+    assert [limiter.allow("user:U1") for _ in range(4)] == [True, True, True, False]
+    assert limiter.allow("user:U2")
+
+    now[0] = 1.5
+    assert limiter.allow("user:U1")
+    assert not limiter.allow("user:U1")
+
+
+def test_token_bucket_is_bounded():
+    limiter = TokenBucketLimiter(rate=1, capacity=1, max_keys=2)
+    for key in "abc":
+        limiter.allow(key)
+
+    assert len(limiter._buckets) == 2
+
+
+def test_token_bucket_refund():
+    limiter = TokenBucketLimiter(rate=1, capacity=1, clock=lambda: 0)
+
+    assert limiter.allow("user:U1")
+    limiter.refund("user:U1")
+    assert limiter.allow("user:U1")
+    assert not limiter.allow("user:U1")
+
+
+def test_rejection_by_channel_does_not_count_against_user(monkeypatch):
+    monkeypatch.setattr(main, "user_limiter", TokenBucketLimiter(rate=1, capacity=1, clock=lambda: 0))
+    monkeypatch.setattr(main, "channel_limiter", TokenBucketLimiter(rate=1, capacity=1, clock=lambda: 0))
+
+    assert main.is_within_rate_limit("U1", "C1")
+    assert not main.is_within_rate_limit("U2", "C1")
+    assert main.is_within_rate_limit("U2", "C2")
+
+
+def test_make_limiter_disabled():
+    limiter = make_limiter(per_minute=0, burst=1)
+
+    assert all(limiter.allow("user:U1") for _ in range(10))
+
+
+def test_concurrency_limiter():
+    limiter = ConcurrencyLimiter(limit=1, timeout=0.01)
+
+    lease = limiter.acquire()
+    assert lease
+    assert not limiter.acquire()
+    limiter.release(lease)
+    assert limiter.acquire()
@@ -0,0 +1,63 @@
+from bot_api.registry import CommandRegistry, edit_distance
+
+
+def noop(args, db=None):
+    return "ok"
+
+
+def make_registry(*names):
+    registry = CommandRegistry()
+    for name in names:
+        registry.add(name, noop, help_text="", usage=f"`/c {name}`")
+    return registry
+
+
+def test_shorthands_in_registration_order():
+    registry = make_registry("schedule", "clear", "cancel", "shorthands")
+
+    assert registry.shorthands == {"s": "schedule", "c": "clear", "ca": "cancel", "sh": "shorthands"}
+
+
+def test_resolve():
+    registry = make_registry("schedule", "clear", "cancel", "shorthands")
+
+    assert registry.resolve("schedule").name == "schedule"
+    assert registry.resolve("s").name == "schedule"
+    assert registry.resolve("sho").name == "shorthands"
+    assert registry.resolve("cle").name == "clear"
+    assert registry.resolve("x") is None
+    assert registry.resolve("schedules") is None
+
+
+def test_resolve_ambiguous_prefix():
+    registry = make_registry("cancel", "cancellations")
+
+    assert registry.resolve("c").name == "cancel"
+    assert registry.resolve("ca").name == "cancellations"
+    assert registry.resolve("cancell").name == "cancellations"
+    assert registry.resolve("can") is None
+
+
+def test_register_decorator():
+    registry = CommandRegistry()
+
+    @registry.register("next", help_text="Displays the next event.", usage="`/c next`", uses_db=False)
+    def list_next_event(args, db=None):
+        return "next"
+
+    assert registry["next"].command is list_next_event
+    assert not registry["next"].uses_db
+
+
+def test_suggest():
+    registry = make_registry("schedule", "clear", "cancel", "upcoming")
+
+    assert registry.suggest("shedule") == ["schedule"]
+    assert registry.suggest("cancle") == ["cancel"]
+    assert registry.suggest("foo") == []
+
+
+def test_edit_distance():
+    assert edit_distance("kitten", "sitting", 5) == 3
+    assert edit_distance("kitten", "sitting", 2) == 3
+    assert edit_distance("next", "next", 2) == 0
@@ -0,0 +1,80 @@
+import datetime
+
+import pytest
+from mock import Mock
+
+from bot_api import crud, models, search
+
+
+def make_event(when, who, what):
+    event = Mock(spec=models.Event)
+    event.when = when
+    event.who = who
+    event.what = what
+    return event
+
+
+@pytest.fixture
+def history():
+    return [
+        make_event(datetime.date(2019, 3, 6), "Jonathan Feinberg", "ChaosPy -- Uncertainty Quantification"),
+        make_event(datetime.date(2019, 4, 5), "Ola Skavhaug", "Rasputin"),
+        make_event(datetime.date(2019, 5, 14), "Simen Tennøe", "Uncertainty quantification in neuroscience"),
+        make_event(datetime.date(2019, 9, 3), "Jonathan Feinberg", "NumPoly"),
+    ]
+
+
+def test_tokenize():
+    assert search.tokenize("ChaosPy -- Numerical software") == ["chaospy", "numerical", "software"]
+    assert search.tokenize("Simen Tennøe") == ["simen", "tennøe"]
+    assert search.tokenize(None) == []
+
+
+def test_event_index_search(history):
+    index = search.EventIndex(history)
+
+    assert index.search(who="ola", what=None) == [datetime.date(2019, 4, 5)]
+    # Both events match equally, the most recent first
+    assert index.search(who="jonathan", what=None) == [datetime.date(2019, 9, 3), datetime.date(2019, 3, 6)]
+    assert index.search(who="jonathan", what="uncertainty") == [datetime.date(2019, 3, 6)]
+    assert index.search(who="nobody", what=None) == []
+    assert index.search(who=None, what=None) == []
+
+
+def test_event_index_prefix_search(history):
+    index = search.EventIndex(history)
+
+    assert index.search(who="tenn", what=None) == [datetime.date(2019, 5, 14)]
+    assert set(index.search(who=None, what="quant")) == {datetime.date(2019, 3, 6), datetime.date(2019, 5, 14)}
+
+
+def test_event_index_ranks_whole_words_first():
+    index = search.EventIndex(
+        [
+            make_event(datetime.date(2020, 1, 1), "Someone", "Numbering"),
+            make_event(datetime.date(2019, 1, 1), "Someone", "Num"),
+        ]
+    )
+
+    assert index.search(who=None, what="num") == [datetime.date(2019, 1, 1), datetime.date(2020, 1, 1)]
+
+
+def test_search_events_sees_writes(db):
+    crud.create_event(db, when=datetime.date(2019, 4, 5), event_type="formiddag")
+    assert crud.search_events(db, who="ola") == []
+
+    db_event = crud.get_event_by_date(db, datetime.date(2019, 4, 5))
+    crud.update_event(db, db_event, who="Ola Skavhaug", what="Rasputin")
+
+    assert [e.what for e in crud.search_events(db, who="ola")] == ["Rasputin"]
+
+
+def test_search_events_paginates(db):
+    for day in range(1, 6):
+        crud.create_event(db, when=datetime.date(2019, 4, day), event_type="formiddag")
+        crud.update_event(db, crud.get_event_by_date(db, datetime.date(2019, 4, day)), who="Ola", what=f"Talk {day}")
+
+    first = crud.search_events(db, who="ola", offset=0, limit=3)
+    second = crud.search_events(db, who="ola", offset=3, limit=3)
+
+    assert [e.when.day for e in first + second] == [5, 4, 3, 2, 1]
@@ -0,0 +1,19 @@
+from bot_api import server
+
+
+def test_get_worker_count_from_cores():
+    assert server.get_worker_count(1) == 3
+    assert server.get_worker_count(2) == 5
+
+
+def test_get_worker_count_bounded_by_memory():
+    assert server.get_worker_count(4, memory_mb=512, worker_memory_mb=128) == 4
+    assert server.get_worker_count(4, memory_mb=64, worker_memory_mb=128) == 1
+
+
+def test_get_worker_count_bounded_by_max_workers():
+    assert server.get_worker_count(16, max_workers=8) == 8
+
+
+def test_get_worker_count_without_preload():
+    assert server.get_worker_count(4, preload=False) == 1
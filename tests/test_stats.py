@@ -0,0 +1,90 @@
+import datetime
+
+from bot_api import commands, crud, models, stats
+
+
+def dump(db):
+    return (
+        [(r.event_type, r.dates, r.talks, r.cancelled) for r in stats.get_schedule_stats(db)],
+        [(r.who, r.talks, r.last_talk) for r in stats.get_presenter_stats(db)],
+        [(r.reason, r.count) for r in stats.get_cancellation_stats(db)],
+    )
+
+
+def schedule(db, when, who, what, event_type="formiddag"):
+    db_event = crud.create_event(db, when=when, event_type=event_type)
+    return crud.update_event(db, db_event, who=who, what=what)
+
+
+def test_crud_writes_update_stats(db):
+    schedule(db, datetime.date(2019, 3, 6), "Jonathan", "ChaosPy")
+    schedule(db, datetime.date(2019, 9, 3), "Jonathan", "NumPoly")
+    schedule(db, datetime.date(2019, 4, 5), "Ola", "Rasputin", event_type="fagdag")
+    schedule(db, datetime.date(2019, 5, 1), None, "Holiday")
+    crud.create_event(db, when=datetime.date(2019, 6, 1), event_type="formiddag")
+
+    assert dump(db) == (
+        [("fagdag", 1, 1, 0), ("formiddag", 4, 2, 1)],
+        [("Ola", 1, datetime.date(2019, 4, 5)), ("Jonathan", 2, datetime.date(2019, 9, 3))],
+        [("Holiday", 1)],
+    )
+
+
+def test_clearing_and_removing_updates_stats(db):
+    schedule(db, datetime.date(2019, 3, 6), "Jonathan", "ChaosPy")
+    last = schedule(db, datetime.date(2019, 9, 3), "Jonathan", "NumPoly")
+    cancelled = schedule(db, datetime.date(2019, 5, 1), None, "Holiday")
+
+    crud.update_event(db, last, who=None, what=None)
+    crud.remove_event(db, when=cancelled.when)
+
+    assert dump(db) == (
+        [("formiddag", 2, 1, 0)],
+        [("Jonathan", 1, datetime.date(2019, 3, 6))],
+        [],
+    )
+
+
+def test_changing_topic_keeps_presenter(db):
+    db_event = schedule(db, datetime.date(2019, 3, 6), "Jonathan", "ChaosPy")
+    crud.update_event(db, db_event, who="Jonathan", what="NumPoly")
+
+    assert dump(db)[1] == [("Jonathan", 1, datetime.date(2019, 3, 6))]
+
+
+def test_rebuild_matches_incremental(db):
+    schedule(db, datetime.date(2019, 3, 6), "Jonathan", "ChaosPy")
+    db_event = schedule(db, datetime.date(2019, 4, 5), "Ola", "Rasputin")
+    crud.update_event(db, db_event, who=None, what="Sick")
+    schedule(db, datetime.date(2019, 5, 1), "Ola", "Rasputin")
+    incremental = dump(db)
+
+    stats.rebuild(db)
+
+    assert dump(db) == incremental
+
+
+def test_rebuild_if_empty(db):
+    db.add(models.Event(when=datetime.date(2019, 3, 6), event_type="formiddag", who="Jonathan", what="ChaosPy"))
+    db.commit()
+
+    stats.rebuild_if_empty(db)
+
+    assert dump(db)[1] == [("Jonathan", 1, datetime.date(2019, 3, 6))]
+
+
+def test_list_stats_shows_last_past_talk_and_scheduled_talk(db):
+    today = datetime.date.today()
+    schedule(db, today - datetime.timedelta(days=30), "Jonathan", "ChaosPy")
+    schedule(db, today + datetime.timedelta(days=7), "Jonathan", "NumPoly")
+    schedule(db, today - datetime.timedelta(days=10), "Ola", "Rasputin")
+    # Left behind by a write around crud
+    db.add(models.PresenterStats(who="Kari", talks=1, last_talk=None))
+    db.commit()
+
+    response = commands.list_stats(commands.get_args_from_request("stats"), db)
+    presenters = response.split("*Presenters* (longest since last talk first)\n")[1].split("\n")
+
+    assert presenters[0] == ">Kari: 1 talks, last talk unknown"
+    assert presenters[1].startswith(">Jonathan: 2 talks, last talk 30 days ago, scheduled for ")
+    assert presenters[2] == ">Ola: 1 talks, last talk 10 days ago"